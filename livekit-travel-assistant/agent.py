@@ -2,26 +2,36 @@ from langchain_core.messages import HumanMessage, AIMessage
 from langgraph.graph import StateGraph, END
 from langchain_core.prompts import PromptTemplate
 from langchain.agents import create_react_agent, AgentExecutor
-from typing import Dict, List, Any
+from typing import Annotated, Dict, List, Any, Optional
+import json
 import logging
+import re
 from datetime import date
 from time import time
-from config import SYSTEM_MESSAGE
+from config import SYSTEM_MESSAGE, AGENT_MAX_ITERATIONS, AGENT_MAX_EXECUTION_TIME, AGENT_MODE, AGENT_SYNTHESIS, LLM_TEXT_MAX_TOKENS
 from database import check_cache, store_query_response
 from tools import tools
+from fast_path import fast_path
+from entity_memory import merge_entities, entities_from_calls, resolve_references
+from tool_grammar import ToolGrammar
+import async_tools
 from llm import DynamicLlamaCpp
 
 logger = logging.getLogger(__name__)
 
 # Initialize LLM
 llm = DynamicLlamaCpp()
+tool_map = {tool.name: tool for tool in tools}
 
-# Standard ReAct prompt (escaped {name} and removed unexpected location variable)
+# SYSTEM_MESSAGE shows JSON examples; escape their braces so only {date} stays a template variable
+SYSTEM_PROMPT = SYSTEM_MESSAGE.replace("{", "{{").replace("}", "}}").replace("{{date}}", "{date}")
+
+# Standard ReAct prompt; create_react_agent fills in {tools} and {tool_names}
 react_prompt = PromptTemplate.from_template(
-    SYSTEM_MESSAGE + """
+    SYSTEM_PROMPT + """
 Answer the following questions as best you can. You have access to the following tools:
 
-{tools_desc}
+{tools}
 
 Use the following format:
 
@@ -41,30 +51,128 @@ Thought: {agent_scratchpad}
 """
 )
 
+# Built once and shared by all requests; the executor keeps no per-request state.
+# The ReAct loop stops after AGENT_MAX_ITERATIONS tool calls or AGENT_MAX_EXECUTION_TIME seconds.
+react_agent = create_react_agent(llm, tools, react_prompt)
+executor = AgentExecutor(
+    agent=react_agent,
+    tools=tools,
+    verbose=False,
+    handle_parsing_errors=True,
+    return_intermediate_steps=True,
+    max_iterations=AGENT_MAX_ITERATIONS,
+    max_execution_time=AGENT_MAX_EXECUTION_TIME,
+    early_stopping_method="force",
+)
+
+# Output of AgentExecutor when early_stopping_method="force" cuts the loop short
+BUDGET_EXHAUSTED_OUTPUT = "Agent stopped due to iteration limit or time limit."
+
+# Plan-then-execute mode (AGENT_MODE=plan): one generation plans every tool call of the turn
+PLAN_TOOLS_DESC = "\n".join(
+    f"{tool.name}: {tool.description} Parameters: {json.dumps({name: arg.get('type', 'string') for name, arg in tool.args.items()})}"
+    for tool in tools
+).replace("{", "{{").replace("}", "}}")
+
+plan_prompt = PromptTemplate.from_template(
+    """You are a travel assistant. Plan all tool calls needed to answer the question at once.
+Respond ONLY with a JSON list of tool calls: [{{"name": "tool_name", "parameters": {{...}}}}]
+Calls in the list must not depend on each other's results. Respond with [] if no tool is needed.
+Resolve references like 'there' from the chat history.
+
+Tools:
+""" + PLAN_TOOLS_DESC + """
+
+Example: for "Trip to Tokyo from London" respond
+[{{"name": "get_weather", "parameters": {{"location": "Tokyo"}}}}, {{"name": "get_flights", "parameters": {{"from_location": "London", "to_location": "Tokyo"}}}}, {{"name": "get_attractions", "parameters": {{"location": "Tokyo"}}}}]
+
+Current date: {date}
+Question: {input}
+Chat history: {history}
+Plan: """
+)
+
+synthesis_prompt = PromptTemplate.from_template(
+    """Question: {input}
+Tool results: {results}
+Answer the question in one friendly paragraph using only these results.
+Answer: """
+)
+
+# Constrains the plan to a list of valid tool calls
+plan_grammar = ToolGrammar(tools, allow_text=False)
+
 class AgentState(Dict):
     messages: List[Any]
-
-def extract_location_from_history(history: str) -> str:
-    """Extracts the last mentioned location from chat history."""
-    lines = history.split("\n")
-    for line in reversed(lines):
-        for city in ["Tokyo", "Paris", "New York", "London", "Mumbai", "New Delhi"]:
-            if city.lower() in line.lower():
-                return city
-    return ""
+    # Last location, flight origin/destination and currencies, updated from successful tool calls
+    entities: Annotated[Dict[str, str], merge_entities]
+
+def partial_answer(intermediate_steps: List) -> str:
+    """Best answer from the tool observations gathered before the budget ran out."""
+    # Parsing errors show up as steps of the internal "_Exception" tool; only real tool results count
+    observations = [str(observation).strip() for action, observation in intermediate_steps
+                    if action.tool in tool_map and str(observation).strip()]
+    if not observations:
+        return "Sorry, I couldn't finish that request in time. Could you ask for one thing at a time?"
+    # Tools return complete sentences, so the distinct results read as an answer
+    return " ".join(dict.fromkeys(observations))
+
+def plan_tool_calls(user_input: str, history: str) -> Optional[List[Dict[str, Any]]]:
+    """One generation that returns the turn's tool calls, [] for none, or None if the plan is unusable."""
+    prompt = plan_prompt.format(date=date.today().strftime('%d %b %Y'), input=user_input, history=history)
+    raw = llm.invoke(prompt, **plan_grammar.kwargs_for()).strip()
+    logger.debug(f"Plan: {raw}")
+    match = re.search(r'\[.*\]', raw, re.DOTALL)
+    if not match:
+        return None
+    try:
+        calls = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        logger.warning(f"Unparseable plan {raw!r}: {e}")
+        return None
+    for call in calls:
+        if not isinstance(call, dict) or call.get("name") not in tool_map or not isinstance(call.get("parameters"), dict):
+            logger.warning(f"Invalid tool call in plan: {call}")
+            return None
+    return calls
+
+def synthesize(user_input: str, results: List[str]) -> str:
+    """Final answer from the tool results: joined as-is by default, or one LLM pass with AGENT_SYNTHESIS=llm."""
+    if AGENT_SYNTHESIS == "llm" and len(results) > 1:
+        try:
+            prompt = synthesis_prompt.format(input=user_input, results=" ".join(results))
+            answer = llm.invoke(prompt, max_tokens=LLM_TEXT_MAX_TOKENS).strip()
+            if answer:
+                return answer
+        except Exception as e:
+            logger.error(f"Synthesis error, using tool results: {e}")
+    # Tools return complete sentences, so their results read as an answer in plan order
+    return " ".join(results)
+
+def plan_and_execute(user_input: str, history: str, start_time: float) -> Optional[Dict[str, List[AIMessage]]]:
+    """Plan the turn's tool calls in one generation and run them concurrently; None falls back to ReAct."""
+    calls = plan_tool_calls(user_input, history)
+    if not calls:
+        # Nothing to call (or no usable plan): let the ReAct agent answer directly
+        return None
+    logger.info(f"Executing plan: {[call['name'] for call in calls]}")
+    results = async_tools.invoke_tools_concurrently(calls, tool_map)
+    entities = entities_from_calls((call["name"], call["parameters"], result) for call, result in zip(calls, results))
+    output = synthesize(user_input, results)
+    tool_name = ",".join(sorted({call["name"] for call in calls}))
+    store_query_response(user_input, output, "plan_execute", date.today().strftime('%Y-%m-%d'), tool_name=tool_name)
+    logger.info(f"Response time (plan, {len(calls)} tool calls): {time() - start_time:.2f} seconds")
+    return {"messages": [AIMessage(content=output)], "entities": entities}
 
 def agent_node(state: AgentState):
     start_time = time()
     user_input = state["messages"][-1].content
     history = "\n".join([f"{msg.type}: {msg.content}" for msg in state["messages"]])
 
-    # Resolve ambiguous references like "there"
-    if "there" in user_input.lower():
-        location = extract_location_from_history(history)
-        if location:
-            user_input = user_input.replace("there", location)
-        else:
-            return {"messages": [AIMessage(content="Please specify the location.")]}
+    # Resolve ambiguous references like "there" from the session's entities
+    user_input = resolve_references(user_input, state.get("entities"))
+    if user_input is None:
+        return {"messages": [AIMessage(content="Please specify the location.")]}
     logger.debug(f"Processed input: {user_input}")
 
     # Check cache
@@ -74,47 +182,54 @@ def agent_node(state: AgentState):
         logger.info(f"Response time (cache hit): {response_time:.2f} seconds")
         return {"messages": [AIMessage(content=cached_response)]}
 
-    # Prepare tool names and descriptions
-    tool_names = ", ".join([tool.name for tool in tools])
-    tools_desc = "\n".join([f"{tool.name}: {tool.description}" for tool in tools])
-
-    # Prepare tools as a list of dict schemas for the agent
-    tools_schemas = [
-        {
-            "type": "function",
-            "function": {
-                "name": tool.name,
-                "description": tool.description,
-                "parameters": tool.args_schema.schema() if tool.args_schema else {}
-            }
-        } for tool in tools
-    ]
-
-    # Create ReAct agent
-    agent = create_react_agent(llm, tools, react_prompt)
-
-    # Use AgentExecutor for chaining (runs the ReAct loop)
-    executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True)
-
-    # Invoke executor
+    # Formulaic requests map straight to a tool call without running the ReAct loop
+    tool_call = fast_path.parse(user_input)
+    if tool_call:
+        try:
+            output = tool_map[tool_call["name"]].invoke(tool_call["parameters"])
+            store_query_response(user_input, output, "fast_path", date.today().strftime('%Y-%m-%d'), tool_name=tool_call["name"])
+            response_time = time() - start_time
+            logger.info(f"Response time (fast path): {response_time:.2f} seconds")
+            entities = entities_from_calls([(tool_call["name"], tool_call["parameters"], output)])
+            return {"messages": [AIMessage(content=output)], "entities": entities}
+        except Exception as e:
+            logger.error(f"Fast path tool error, falling back to agent: {e}")
+
+    if AGENT_MODE == "plan":
+        try:
+            result = plan_and_execute(user_input, history, start_time)
+            if result is not None:
+                return result
+        except Exception as e:
+            logger.error(f"Plan execution error, falling back to ReAct: {e}")
+
+    # Invoke the shared executor
     try:
         response = executor.invoke({
             "input": user_input,
             "history": history,
             "date": date.today().strftime('%d %b %Y'),
-            "agent_scratchpad": "",
-            "tool_names": tool_names,
-            "tools_desc": tools_desc,
-            "tools": tools_schemas
         })
         output = response["output"]
         logger.debug(f"Agent output: {output}")
+        steps = response.get("intermediate_steps", [])
+        entities = entities_from_calls((action.tool, action.tool_input, observation) for action, observation in steps)
+
+        if output == BUDGET_EXHAUSTED_OUTPUT:
+            output = partial_answer(steps)
+            # Not cached: the same question may finish within budget next time
+            logger.warning(f"Agent budget exhausted after {len(steps)} steps, {time() - start_time:.2f} seconds; returning partial answer")
+            return {"messages": [AIMessage(content=output)], "entities": entities}
+
+        # Label the response with the tools it used so the cache applies their TTLs
+        used_tools = sorted({action.tool for action, _ in steps})
+        tool_name = ",".join(used_tools) if used_tools else "none"
 
         # Store in database
-        store_query_response(user_input, output, "react_agent", date.today().strftime('%Y-%m-%d'))
+        store_query_response(user_input, output, "react_agent", date.today().strftime('%Y-%m-%d'), tool_name=tool_name)
         response_time = time() - start_time
         logger.info(f"Response time (agent): {response_time:.2f} seconds")
-        return {"messages": [AIMessage(content=output)]}
+        return {"messages": [AIMessage(content=output)], "entities": entities}
     except Exception as e:
         logger.error(f"Agent execution error: {e}")
         return {"messages": [AIMessage(content=f"Error processing request: {str(e)}")]}
@@ -0,0 +1,128 @@
+import bisect
+import csv
+import logging
+import re
+import unicodedata
+from collections import namedtuple
+from typing import Dict, List, Optional
+from fuzzywuzzy import fuzz
+from config import AIRPORTS_CSV_PATH
+
+logger = logging.getLogger(__name__)
+
+Airport = namedtuple("Airport", ["code", "kind", "name", "city", "country"])
+AirportMatch = namedtuple("AirportMatch", ["airport", "matched_by"])
+
+# Words users add around a place name that never help the lookup
+NOISE_WORDS = re.compile(r"\b(airport|airports|international|intl|city of)\b")
+# Memoized lookups are dropped wholesale past this many distinct inputs
+MEMO_MAX_ENTRIES = 4096
+
+class AirportIndex:
+    """Offline resolver from free-form city or airport names to IATA codes.
+
+    Loads the bundled airports.csv into an exact-name dict (city names, airport
+    names and aliases) plus a sorted key list for prefix search. A city
+    resolves to its metro code (e.g. LON) when the dataset has one, otherwise to
+    its first listed airport. Names that match nothing exactly fall back to a
+    leading-words, prefix and then a fuzz.ratio search; all results are memoized.
+    """
+
+    def __init__(self, csv_path: str = AIRPORTS_CSV_PATH, fuzzy_threshold: int = 80):
+        self.csv_path = csv_path
+        self.fuzzy_threshold = fuzzy_threshold
+        self.airports: Dict[str, Airport] = {}
+        self._names: Dict[str, Airport] = {}
+        self._keys: List[str] = []
+        self._memo: Dict[str, Optional[AirportMatch]] = {}
+        self.load()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercase, strip accents and punctuation: 'São Paulo Intl.' -> 'sao paulo'."""
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+        text = NOISE_WORDS.sub(" ", re.sub(r"[^\w\s]", " ", text))
+        return re.sub(r"\s+", " ", text).strip()
+
+    def load(self):
+        """Read the dataset; rows are listed metro codes first, then airports in order of importance."""
+        try:
+            with open(self.csv_path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    airport = Airport(row["code"], row["kind"], row["name"], row["city"], row["country"])
+                    self.airports[airport.code] = airport
+                    # The first row for a name wins, so metro codes beat their airports
+                    names = [airport.city, airport.name] + [alias for alias in row["aliases"].split("|") if alias]
+                    for name in names:
+                        self._names.setdefault(self.normalize(name), airport)
+            self._keys = sorted(self._names)
+            self._memo.clear()
+            logger.info(f"Loaded {len(self.airports)} airports and {len(self._keys)} names from {self.csv_path}")
+        except Exception as e:
+            logger.error(f"Error loading airport dataset {self.csv_path}: {e}")
+
+    def _leading_words_match(self, query: str) -> Optional[Airport]:
+        # "sydney australia" -> "sydney", "frankfurt am main" -> "frankfurt"
+        words = query.split()
+        for n in range(len(words) - 1, 0, -1):
+            airport = self._names.get(" ".join(words[:n]))
+            if airport:
+                return airport
+        return None
+
+    def _prefix_match(self, query: str) -> Optional[Airport]:
+        start = bisect.bisect_left(self._keys, query)
+        candidates = []
+        for key in self._keys[start:]:
+            if not key.startswith(query):
+                break
+            candidates.append(self._names[key])
+        if not candidates:
+            return None
+        # Prefer metro codes, then the shortest name ("san fran" -> "san francisco", not "san francisco international")
+        return min(candidates, key=lambda airport: (airport.kind != "city", len(airport.city)))
+
+    def _fuzzy_match(self, query: str) -> Optional[Airport]:
+        best_key, best_score = None, self.fuzzy_threshold - 1
+        for key in self._keys:
+            # fuzz.ratio cannot reach the threshold when the lengths differ this much
+            if abs(len(key) - len(query)) * 100 > (100 - self.fuzzy_threshold) * (len(key) + len(query)):
+                continue
+            score = fuzz.ratio(query, key)
+            if score > best_score:
+                best_key, best_score = key, score
+        return self._names[best_key] if best_key else None
+
+    def resolve(self, text: str) -> Optional[AirportMatch]:
+        """Return the best airport for a place name or code, with how it matched, or None."""
+        if not text:
+            return None
+        query = self.normalize(text)
+        if query in self._memo:
+            return self._memo[query]
+        match = None
+        if query in self._names:
+            match = AirportMatch(self._names[query], "name")
+        elif len(query) == 3 and query.upper() in self.airports:
+            match = AirportMatch(self.airports[query.upper()], "code")
+        else:
+            for matched_by, lookup in (("name", self._leading_words_match), ("prefix", self._prefix_match),
+                                       ("fuzzy", self._fuzzy_match)):
+                airport = lookup(query) if len(query) >= 3 else None
+                if airport:
+                    match = AirportMatch(airport, matched_by)
+                    break
+        if match:
+            logger.debug(f"Resolved '{text}' to {match.airport.code} by {match.matched_by}")
+        if len(self._memo) >= MEMO_MAX_ENTRIES:
+            self._memo.clear()
+        self._memo[query] = match
+        return match
+
+    def code_for(self, text: str) -> Optional[str]:
+        """Return the IATA metro or airport code for a place name, or None if it is unknown."""
+        match = self.resolve(text)
+        return match.airport.code if match else None
+
+# Shared by tools.py, hybrid_rasa_llm.py and the Rasa actions
+airport_index = AirportIndex()
@@ -0,0 +1,177 @@
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from time import sleep, time
+from typing import Optional, Tuple
+import http_client
+from config import AMADEUS_API_KEY, AMADEUS_API_SECRET, AMADEUS_TOKEN_DB_PATH, AMADEUS_TOKEN_REFRESH_MARGIN
+
+logger = logging.getLogger(__name__)
+
+TOKEN_URL = "https://test.api.amadeus.com/v1/security/oauth2/token"
+# A token this close to expiry is never handed out
+EXPIRY_SAFETY = 30
+# Background refresh retries after a failure back off exponentially between these bounds (seconds)
+REFRESH_RETRY_MIN = 5
+REFRESH_RETRY_MAX = 300
+
+class AmadeusTokenManager:
+    """Shares one Amadeus OAuth token between threads and processes.
+
+    The token is kept in a small SQLite store that the Flask service and the
+    Rasa action server both read. A file lock ensures only one process asks
+    Amadeus for a new token at a time; the others pick it up from the store.
+    A background thread refreshes the token refresh_margin seconds before it
+    expires, so requests do not pay for the round trip.
+    """
+
+    def __init__(self, db_path: str = AMADEUS_TOKEN_DB_PATH, refresh_margin: int = AMADEUS_TOKEN_REFRESH_MARGIN,
+                 client_id: Optional[str] = AMADEUS_API_KEY, client_secret: Optional[str] = AMADEUS_API_SECRET):
+        self.db_path = db_path
+        self.refresh_margin = refresh_margin
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self.init_db()
+
+    def init_db(self):
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS amadeus_token (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        access_token TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error initializing Amadeus token store: {e}")
+
+    @contextmanager
+    def _process_lock(self):
+        with open(f"{self.db_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_store(self) -> Optional[Tuple[str, float]]:
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                return conn.execute("SELECT access_token, expires_at FROM amadeus_token WHERE id = 1").fetchone()
+        except Exception as e:
+            logger.error(f"Error reading Amadeus token store: {e}")
+            return None
+
+    def _write_store(self, token: str, expires_at: float):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("INSERT OR REPLACE INTO amadeus_token (id, access_token, expires_at) VALUES (1, ?, ?)",
+                             (token, expires_at))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error writing Amadeus token store: {e}")
+
+    def _is_fresh(self, expires_at: float) -> bool:
+        return time() < expires_at - self.refresh_margin
+
+    def _request_token(self) -> Tuple[str, float]:
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret
+        }
+        response = http_client.post(TOKEN_URL, data=data).json()
+        logger.debug(f"Amadeus token response: {response}")
+        access_token = response.get("access_token")
+        if not access_token:
+            raise ValueError("Failed to authenticate with Amadeus API.")
+        return access_token, time() + response.get("expires_in", 1799)
+
+    def refresh(self, force: bool = False, rejected: Optional[str] = None) -> str:
+        """Adopt a fresh token from the shared store, or request a new one under the process lock.
+
+        With force, the current token is replaced even if fresh, unless it is no
+        longer the rejected one (another thread already replaced it).
+        """
+        with self._lock:
+            if force and rejected is not None and self._token and self._token != rejected and time() < self._expires_at - EXPIRY_SAFETY:
+                return self._token
+            if not force and self._token and self._is_fresh(self._expires_at):
+                return self._token
+            with self._process_lock():
+                stored = self._read_store()
+                if stored and not force and self._is_fresh(stored[1]):
+                    self._token, self._expires_at = stored
+                    return self._token
+                if force and stored and stored[0] != self._token and self._is_fresh(stored[1]):
+                    # Another process already replaced the token we were told to drop
+                    self._token, self._expires_at = stored
+                    return self._token
+                try:
+                    self._token, self._expires_at = self._request_token()
+                except Exception as e:
+                    logger.error(f"Amadeus API error: {e}")
+                    # Fall back to a stored token that is past its refresh point but not yet expired
+                    if stored and time() < stored[1]:
+                        self._token, self._expires_at = stored
+                        return self._token
+                    raise
+                self._write_store(self._token, self._expires_at)
+                logger.info("Refreshed Amadeus access token")
+                return self._token
+
+    def get_token(self) -> str:
+        """Return a valid access token; raises ValueError if Amadeus rejects the credentials."""
+        self._ensure_refresher()
+        token, expires_at = self._token, self._expires_at
+        if token and time() < expires_at - EXPIRY_SAFETY:
+            # Inside the refresh window the background thread is already replacing it
+            return token
+        return self.refresh()
+
+    def invalidate(self, token: Optional[str] = None) -> str:
+        """Replace the token Amadeus answered 401 to and return the new one.
+
+        Passing the rejected token lets concurrent callers that saw the same 401
+        share one replacement.
+        """
+        logger.warning("Amadeus rejected the access token, requesting a new one")
+        return self.refresh(force=True, rejected=token)
+
+    def _ensure_refresher(self):
+        if self._refresher is None:
+            with self._lock:
+                if self._refresher is None:
+                    self._refresher = threading.Thread(target=self._refresh_loop, name="amadeus-token", daemon=True)
+                    self._refresher.start()
+
+    def _refresh_loop(self):
+        failures = 0
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Background Amadeus token refresh failed: {e}")
+            if self._token and self._is_fresh(self._expires_at):
+                failures = 0
+                # Wake up when the token enters its refresh window
+                wait = max(self._expires_at - self.refresh_margin - time(), 1.0)
+            else:
+                # Failed, or fell back to a stored token that is already due for refresh
+                wait = min(REFRESH_RETRY_MIN * 2 ** failures, REFRESH_RETRY_MAX)
+                failures += 1
+                logger.info(f"Retrying Amadeus token refresh in {wait:.0f} seconds")
+            sleep(wait)
+
+# Shared by tools.py, hybrid_rasa_llm.py and the Rasa actions
+amadeus_tokens = AmadeusTokenManager()
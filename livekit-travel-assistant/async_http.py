@@ -0,0 +1,74 @@
+import asyncio
+import atexit
+import logging
+import threading
+from typing import Any, Awaitable, Optional
+import aiohttp
+from config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_RETRIES, HTTP_POOL_MAXSIZE
+from http_client import retry_budget
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# One background event loop owns the aiohttp session so keep-alive connections
+# survive across Flask requests, which run on ordinary (sync) threads.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_session: Optional[aiohttp.ClientSession] = None
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-http", daemon=True).start()
+                _loop = loop
+    return _loop
+
+def run_async(coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the shared background loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+async def get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=HTTP_POOL_MAXSIZE, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+        )
+    return _session
+
+async def request_json(method: str, url: str, **kwargs) -> Any:
+    """Send a request on the shared session and decode the JSON body, retrying like http_client."""
+    session = await get_session()
+    retry_budget.record_request()
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        can_retry = attempt < HTTP_MAX_RETRIES
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                if response.status in RETRY_STATUSES and can_retry and retry_budget.acquire():
+                    logger.warning(f"Retrying {url} after HTTP {response.status}")
+                else:
+                    return await response.json(content_type=None)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if not (can_retry and method == "GET" and retry_budget.acquire()):
+                raise
+            logger.warning(f"Retrying {url} after {e!r}")
+        await asyncio.sleep(0.3 * 2 ** attempt)
+
+async def get_json(url: str, params=None, headers=None) -> Any:
+    return await request_json("GET", url, params=params, headers=headers)
+
+async def post_json(url: str, data=None, json=None, headers=None) -> Any:
+    return await request_json("POST", url, data=data, json=json, headers=headers)
+
+def _close_session():
+    if _session is not None and not _session.closed and _loop is not None:
+        try:
+            run_async(_session.close(), timeout=5)
+        except Exception as e:
+            logger.warning(f"Error closing async HTTP session: {e}")
+
+atexit.register(_close_session)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from datetime import datetime, date
+from typing import Any, Dict, List
+from config import OPENWEATHERMAP_API_KEY, GEOAPIFY_API_KEY, TIMEZONEDB_API_KEY
+from async_http import get_json, run_async
+
+logger = logging.getLogger(__name__)
+
+# Async implementations of the HTTP-bound tools. tools.py and hybrid_rasa_llm.py
+# attach these as the coroutine of their @tool functions, so tool.ainvoke() does
+# not block a thread while waiting on the upstream API.
+
+async def _geocode(geolocator, location: str):
+    # Geocode cache hits are in memory; misses go to Nominatim on a worker thread
+    return await asyncio.to_thread(geolocator.geocode, location)
+
+async def fetch_weather(location: str, geolocator) -> str:
+    loc = await _geocode(geolocator, location)
+    if not loc:
+        return "Location not found. Ask for confirmation."
+    url = "https://api.openweathermap.org/data/2.5/weather"
+    params = {"lat": str(loc.latitude), "lon": str(loc.longitude), "appid": OPENWEATHERMAP_API_KEY, "units": "metric"}
+    try:
+        response = await get_json(url, params=params)
+        logger.debug(f"Weather API response: {response}")
+        if response['cod'] != 200:
+            return f"Weather data not available: {response.get('message', 'Unknown error')}"
+        temp = response['main']['temp']
+        description = response['weather'][0]['description']
+        pack = "Pack light clothes and sunscreen" if temp > 20 else "Bring layers and an umbrella"
+        return f"Current weather in {location}: {temp}°C, {description}. {pack}."
+    except Exception as e:
+        logger.error(f"Weather API error: {e}")
+        return f"Error fetching weather data: {str(e)}"
+
+async def fetch_attractions(location: str, geolocator, radius: int = 10000) -> str:
+    loc = await _geocode(geolocator, location)
+    if not loc:
+        return "Location not found. Ask for confirmation."
+    url = "https://api.geoapify.com/v2/places"
+    params = {
+        "categories": "tourism.attraction",
+        "filter": f"circle:{loc.longitude},{loc.latitude},{radius}",
+        "apiKey": GEOAPIFY_API_KEY
+    }
+    try:
+        response = await get_json(url, params=params)
+        logger.debug(f"Attractions API response: {response}")
+        attractions = [feature['properties']['name'] for feature in response['features'] if 'name' in feature['properties']][:3]
+        if not attractions:
+            return f"No attractions found in {location}."
+        return f"Top attractions in {location}: {', '.join(attractions)}."
+    except Exception as e:
+        logger.error(f"Attractions API error: {e}")
+        return f"Error fetching attractions: {str(e)}"
+
+async def fetch_time(location: str, geolocator) -> str:
+    loc = await _geocode(geolocator, location)
+    if not loc:
+        return "Location not found. Ask for confirmation."
+    url = "http://api.timezonedb.com/v2.1/get-time-zone"
+    params = {"key": TIMEZONEDB_API_KEY, "format": "json", "by": "position", "lat": str(loc.latitude), "lng": str(loc.longitude)}
+    try:
+        response = await get_json(url, params=params)
+        logger.debug(f"Time API response: {response}")
+        if response['status'] == 'OK':
+            time = datetime.fromtimestamp(response['timestamp']).strftime('%H:%M')
+            return f"Current time in {location}: {time} ({response['zoneName']})."
+        return f"Time data not available: {response.get('message', 'Unknown error')}"
+    except Exception as e:
+        logger.error(f"Time API error: {e}")
+        return f"Error fetching time: {str(e)}"
+
+async def fetch_flights(from_location: str, to_location: str, from_code: str, to_code: str,
+                        offers) -> str:
+    try:
+        response = await offers.asearch(from_code, to_code, date.today().isoformat(), adults=1)
+        logger.debug(f"Flights API response: {response}")
+        if 'data' in response and response['data']:
+            flight = response['data'][0]
+            duration = flight['itineraries'][0]['duration']
+            price = flight['price']['total']
+            return f"Found flight from {from_location} to {to_location}: Duration {duration}, price {price} EUR."
+        return "No flights found for the specified route or date."
+    except Exception as e:
+        logger.error(f"Flights API error: {e}")
+        return f"Error searching flights: {str(e)}"
+
+async def run_tool_calls(tool_calls: List[Dict[str, Any]], tool_map: Dict[str, Any]) -> List[str]:
+    """Run independent {"name", "parameters"} tool calls concurrently, preserving order."""
+    async def run_one(tool_call):
+        try:
+            return await tool_map[tool_call["name"]].ainvoke(tool_call["parameters"])
+        except Exception as e:
+            logger.error(f"Tool execution error: {e}")
+            return f"Error executing tool {tool_call['name']}: {str(e)}"
+    return list(await asyncio.gather(*(run_one(tool_call) for tool_call in tool_calls)))
+
+def invoke_tools_concurrently(tool_calls: List[Dict[str, Any]], tool_map: Dict[str, Any]) -> List[str]:
+    """Blocking wrapper for sync callers such as the Flask request thread."""
+    return run_async(run_tool_calls(tool_calls, tool_map))
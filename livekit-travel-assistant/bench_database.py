@@ -0,0 +1,81 @@
+# bench_database.py
+# Micro-benchmark for per-call SQLite overhead in database.py: a new connection per
+# call (the old behaviour) versus the per-thread ConnectionManager connection.
+# Usage: python3 bench_database.py [iterations]
+
+import os
+import sqlite3
+import sys
+import tempfile
+import timeit
+from db_connection import ConnectionManager
+
+SELECT_SQL = '''
+    SELECT response, tool_name, timestamp FROM query_history
+    WHERE query = ?
+    ORDER BY timestamp DESC LIMIT 1
+'''
+INSERT_SQL = "INSERT INTO query_history (query, response, model_type, date, query_count, tool_name) VALUES (?, ?, ?, ?, ?, ?)"
+
+def create_db(db_path: str, rows: int = 5000):
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE query_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            query TEXT NOT NULL,
+            response TEXT NOT NULL,
+            model_type TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            date TEXT,
+            query_count INTEGER DEFAULT 1,
+            tool_name TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX idx_query ON query_history (query)")
+    conn.executemany(INSERT_SQL, [(f"weather in city {i}", f"response {i}", "react_agent", "2025-01-01", 1, "get_weather")
+                                  for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        create_db(db_path)
+        manager = ConnectionManager(db_path)
+
+        def select_per_call():
+            conn = sqlite3.connect(db_path)
+            try:
+                conn.execute(SELECT_SQL, ("weather in city 42",)).fetchone()
+            finally:
+                conn.close()
+
+        def select_managed():
+            manager.get().execute(SELECT_SQL, ("weather in city 42",)).fetchone()
+
+        def insert_per_call():
+            conn = sqlite3.connect(db_path)
+            try:
+                conn.execute(INSERT_SQL, ("q", "r", "react_agent", "2025-01-01", 1, "none"))
+                conn.commit()
+            finally:
+                conn.close()
+
+        def insert_managed():
+            conn = manager.get()
+            conn.execute(INSERT_SQL, ("q", "r", "react_agent", "2025-01-01", 1, "none"))
+            conn.commit()
+
+        print(f"{'benchmark':<28}{'us/call':>10}")
+        for name, fn in [("select, connect per call", select_per_call),
+                         ("select, managed connection", select_managed),
+                         ("insert, connect per call", insert_per_call),
+                         ("insert, managed connection", insert_managed)]:
+            fn()  # warm up (opens the managed connection, switches to WAL)
+            seconds = min(timeit.repeat(fn, number=iterations, repeat=3))
+            print(f"{name:<28}{seconds / iterations * 1e6:>10.1f}")
+        manager.close_all()
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,9 +12,130 @@ GEOAPIFY_API_KEY = os.getenv("GEOAPIFY_API_KEY")
 TIMEZONEDB_API_KEY = os.getenv("TIMEZONEDB_API_KEY")
 
 DB_PATH = "/home/stjl0/livekit-travel-voice-assistant/db/query_history.db"
+# Persistent geocode cache shared by the Flask tools and the Rasa action server
+GEOCODE_DB_PATH = os.getenv("GEOCODE_DB_PATH", os.path.join(os.path.dirname(DB_PATH), "geocode_cache.db"))
 
 MODEL_1B_PATH = os.path.expanduser("~/.llama/checkpoints/Llama3.2-1B-Instruct.gguf")
 MODEL_3B_PATH = os.path.expanduser("~/.llama/checkpoints/Llama3.2-3B-Instruct.gguf")
+# Models are loaded on first use (memory-mapped) and unloaded after this many idle
+# seconds (0 keeps them resident). MODEL_WARMUP lists models loaded at service start.
+MODEL_USE_MMAP = os.getenv("MODEL_USE_MMAP", "true").lower() == "true"
+MODEL_IDLE_UNLOAD = float(os.getenv("MODEL_IDLE_UNLOAD", "1800"))
+MODEL_WARMUP = [name for name in os.getenv("MODEL_WARMUP", "1b").split(",") if name]
+# Per-host llama.cpp settings (thread count, batch size, quantization, GPU layers)
+# written by tune_inference.py and applied by model_loader.load_llama when present
+INFERENCE_PROFILE_PATH = os.getenv("INFERENCE_PROFILE_PATH", os.path.join(
+    os.path.dirname(DB_PATH), f"inference_profile.{socket.gethostname()}.json"))
+# Inference contexts per model for the /llm scheduler. Contexts share the memory-mapped
+# weights; LLM_THREADS (default: all cores) is split evenly across all of them.
+LLM_CONTEXTS_PER_MODEL = int(os.getenv("LLM_CONTEXTS_PER_MODEL", "1"))
+LLM_THREADS = int(os.getenv("LLM_THREADS", str(os.cpu_count() or 4)))
+# Speculative decoding: the 3B model verifies SPECULATIVE_DRAFT_TOKENS tokens drafted by the
+# 1B model per step. SPECULATIVE_BASELINE_RATE of 3B generations run without the draft to
+# measure the speedup. Needs logits for all positions, so it costs extra memory.
+SPECULATIVE_DECODING = os.getenv("SPECULATIVE_DECODING", "false").lower() == "true"
+SPECULATIVE_DRAFT_TOKENS = int(os.getenv("SPECULATIVE_DRAFT_TOKENS", "5"))
+SPECULATIVE_BASELINE_RATE = float(os.getenv("SPECULATIVE_BASELINE_RATE", "0.1"))
+
+# LangGraph conversation checkpoints per /llm session_id (session_store.py): the most
+# recently used SESSION_CACHE_MAX_SESSIONS stay in memory, sessions idle for SESSION_TTL
+# seconds expire on disk
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(os.path.dirname(DB_PATH), "sessions.db"))
+SESSION_CACHE_MAX_SESSIONS = int(os.getenv("SESSION_CACHE_MAX_SESSIONS", "256"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+
+# Shared Amadeus OAuth token store, refreshed this many seconds before expiry
+AMADEUS_TOKEN_DB_PATH = os.getenv("AMADEUS_TOKEN_DB_PATH", os.path.join(os.path.dirname(DB_PATH), "amadeus_token.db"))
+AMADEUS_TOKEN_REFRESH_MARGIN = int(os.getenv("AMADEUS_TOKEN_REFRESH_MARGIN", "300"))
+
+# Bundled offline airport/city dataset used to resolve place names to IATA codes
+AIRPORTS_CSV_PATH = os.getenv("AIRPORTS_CSV_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "airports.csv"))
+
+# Flight search results are cached per (origin, destination, date, adults) for this many seconds
+FLIGHT_CACHE_TTL = int(os.getenv("FLIGHT_CACHE_TTL", "600"))
+FLIGHT_CACHE_MAX_ENTRIES = int(os.getenv("FLIGHT_CACHE_MAX_ENTRIES", "256"))
+
+# Shared HTTP client for external APIs: timeouts in seconds, retries per request,
+# and a retry budget capping retries to a fraction of recent requests
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+HTTP_RETRY_BUDGET_RATIO = float(os.getenv("HTTP_RETRY_BUDGET_RATIO", "0.1"))
+HTTP_RETRY_BUDGET_MIN = int(os.getenv("HTTP_RETRY_BUDGET_MIN", "10"))
+# The /llm fallback generates with a local model, so it gets a longer read timeout
+LLM_FALLBACK_TIMEOUT = float(os.getenv("LLM_FALLBACK_TIMEOUT", "120"))
+
+# LLM inference scheduler: requests queued per model before /llm answers 503,
+# and how long (seconds) a request may wait in the queue before it is dropped
+LLM_MAX_QUEUE_DEPTH = int(os.getenv("LLM_MAX_QUEUE_DEPTH", "8"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+# Model router (model_router.py): per-turn signals are weighted and summed; a score
+# at or above ROUTER_THRESHOLD goes to the 3B model. ROUTER_FORCE_MODEL=1b|3b pins one.
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "1.0"))
+ROUTER_HISTORY_TURNS = int(os.getenv("ROUTER_HISTORY_TURNS", "4"))
+ROUTER_FORCE_MODEL = os.getenv("ROUTER_FORCE_MODEL", "")
+ROUTER_WEIGHTS = {
+    "single_tool": float(os.getenv("ROUTER_WEIGHT_SINGLE_TOOL", "-1.0")),
+    "multi_tool": float(os.getenv("ROUTER_WEIGHT_MULTI_TOOL", "1.0")),
+    "open_ended": float(os.getenv("ROUTER_WEIGHT_OPEN_ENDED", "1.0")),
+    "long_input": float(os.getenv("ROUTER_WEIGHT_LONG_INPUT", "0.5")),
+    "context_reference": float(os.getenv("ROUTER_WEIGHT_CONTEXT_REFERENCE", "0.75")),
+    "history": float(os.getenv("ROUTER_WEIGHT_HISTORY", "0.5")),
+    "rasa_confidence": float(os.getenv("ROUTER_WEIGHT_RASA_CONFIDENCE", "1.0")),
+}
+
+# Grammar-constrained decoding for /llm (tool_grammar.py): output is limited to tool-call
+# JSON (at most LLM_MAX_TOOL_CALLS calls) or one line of text. max_tokens covers the longest
+# output the grammar allows: LLM_TEXT_MAX_TOKENS of text, or LLM_MAX_TOOL_CALLS calls with
+# LLM_ARG_MAX_TOKENS per argument.
+LLM_GRAMMAR = os.getenv("LLM_GRAMMAR", "true").lower() == "true"
+LLM_MAX_TOOL_CALLS = int(os.getenv("LLM_MAX_TOOL_CALLS", "3"))
+LLM_TEXT_MAX_TOKENS = int(os.getenv("LLM_TEXT_MAX_TOKENS", "160"))
+LLM_ARG_MAX_TOKENS = int(os.getenv("LLM_ARG_MAX_TOKENS", "16"))
+
+# Prompt history budget (estimated tokens) for /llm: the most recent turns that fit
+# LLM_HISTORY_TOKENS are sent verbatim, older ones as a summary of LLM_SUMMARY_TOKENS
+LLM_HISTORY_TOKENS = int(os.getenv("LLM_HISTORY_TOKENS", "256"))
+LLM_SUMMARY_TOKENS = int(os.getenv("LLM_SUMMARY_TOKENS", "96"))
+
+# SQLite tuning applied once per reused connection (see db_connection.py)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(16 * 1024)))
+SQLITE_CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "128"))
+
+# Background query_history writer: flush interval (seconds) and max rows per transaction
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5"))
+HISTORY_MAX_BATCH = int(os.getenv("HISTORY_MAX_BATCH", "64"))
+
+# Response cache: size of the in-process LRU tier and TTLs (seconds) per tool_name.
+# A TTL of 0 disables caching for that tool; currency conversions are also
+# invalidated whenever the exchange rates are updated: at once in the process that
+# updated them, and within CURRENCY_RATES_CHECK_INTERVAL seconds in the other
+# processes sharing exchange_rates.db (Flask service, Rasa actions, agent).
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+RESPONSE_CACHE_DEFAULT_TTL = int(os.getenv("RESPONSE_CACHE_DEFAULT_TTL", str(24 * 3600)))
+CURRENCY_RATES_CHECK_INTERVAL = int(os.getenv("CURRENCY_RATES_CHECK_INTERVAL", "60"))
+TOOL_CACHE_TTLS = {
+    "get_weather": int(os.getenv("CACHE_TTL_WEATHER", "600")),
+    "get_time": 0,
+    "get_flights": int(os.getenv("CACHE_TTL_FLIGHTS", "900")),
+    "get_currency_conversion": 12 * 3600,
+    "update_currency_rates": 0,
+    "get_attractions": int(os.getenv("CACHE_TTL_ATTRACTIONS", str(7 * 24 * 3600))),
+    "get_joke": 7 * 24 * 3600,
+}
+
+# ReAct agent (agent.py) budget per request: tool-call iterations and wall-clock seconds,
+# after which the agent answers from the observations it has so far
+AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "4"))
+AGENT_MAX_EXECUTION_TIME = float(os.getenv("AGENT_MAX_EXECUTION_TIME", "20"))
+# AGENT_MODE=plan plans all tool calls of a turn in one generation and runs them concurrently,
+# falling back to the ReAct loop when no tool is needed. AGENT_SYNTHESIS=llm adds one generation
+# to word the combined results; the default joins the tool results as they are.
+AGENT_MODE = os.getenv("AGENT_MODE", "react")
+AGENT_SYNTHESIS = os.getenv("AGENT_SYNTHESIS", "template")
 
 SYSTEM_MESSAGE = """You are a travel assistant following ReAct principles: Reason step-by-step, Act by calling tools, Observe results, Repeat if needed. Respond EXCLUSIVELY with:
 - A single valid JSON object for single tool calls: {"name": "tool_name", "parameters": {...}}.
@@ -0,0 +1,50 @@
+import logging
+from typing import Any, List, Tuple
+from config import LLM_HISTORY_TOKENS, LLM_SUMMARY_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Characters of each side of a turn kept in its summary line
+SUMMARY_LINE_CHARS = 80
+
+def estimate_tokens(text: str) -> int:
+    """Rough Llama token count (about four characters per token) without touching a model context."""
+    return len(text) // 4 + 1
+
+def format_message(msg: Any) -> str:
+    return f"{msg.type}: {msg.content}"
+
+def split_window(messages: List[Any], budget: int = LLM_HISTORY_TOKENS) -> Tuple[List[Any], List[Any]]:
+    """Split messages into (older, recent) so recent is the longest suffix that fits budget tokens.
+
+    The last message is always kept so the current turn is never dropped.
+    """
+    used = 0
+    start = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        used += estimate_tokens(format_message(messages[i]))
+        if used > budget and i < len(messages) - 1:
+            break
+        start = i
+    return messages[:start], messages[start:]
+
+def _clip(text: str) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= SUMMARY_LINE_CHARS else text[:SUMMARY_LINE_CHARS - 3] + "..."
+
+def fold_summary(summary: str, older: List[Any], budget: int = LLM_SUMMARY_TOKENS) -> str:
+    """Append one clipped line per older message to summary, dropping the oldest lines past budget tokens."""
+    lines = [line for line in summary.split("\n") if line]
+    for msg in older:
+        lines.append(f"{msg.type}: {_clip(msg.content)}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+def render_history(summary: str, recent: List[Any]) -> str:
+    """History text for the prompt: the summary of older turns, then the recent messages verbatim."""
+    parts = []
+    if summary:
+        parts.append(f"Earlier in this conversation:\n{summary}")
+    parts.extend(format_message(msg) for msg in recent)
+    return "\n".join(parts)
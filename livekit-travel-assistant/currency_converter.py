@@ -6,7 +6,7 @@
 import sqlite3
 import requests
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
 import time
@@ -25,13 +25,17 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class CurrencyConverter:
-    def __init__(self, access_key: str, db_path: str = "/home/stjl0/livekit-travel-voice-assistant/db/exchange_rates.db", query_db_path: str = "/home/stjl0/livekit-travel-voice-assistant/db/query_history.db", base_url: str = "http://api.exchangeratesapi.io/v1/"):
+    def __init__(self, access_key: str, db_path: str = "/home/stjl0/livekit-travel-voice-assistant/db/exchange_rates.db", query_db_path: str = "/home/stjl0/livekit-travel-voice-assistant/db/query_history.db", base_url: str = "http://api.exchangeratesapi.io/v1/",
+                 rates_check_interval: int = 60):
         self.access_key = access_key
         self.base_url = base_url
         self.db_path = db_path
         self.query_db_path = query_db_path
+        self.rates_check_interval = rates_check_interval
+        self.update_listeners: List[Callable[[], None]] = []
         self.scheduler = BackgroundScheduler()
         self.init_db()
+        self._rates_version = self.rates_version()
         self.schedule_update()
 
     def init_db(self):
@@ -120,15 +124,52 @@ class CurrencyConverter:
                 logger.error(f"Error logging to query_history.db: {e}")
             
             logger.info(f"Updated rates in database: {rates}")
+            self._rates_version = self.rates_version()
+            self._notify_update_listeners()
             return {"success": True, "rates": rates, "date": date}
         except Exception as e:
             logger.error(f"Error updating rates: {e}")
             return {"success": False, "error": str(e)}
 
+    def add_update_listener(self, listener: Callable[[], None]):
+        """Register a callback run after every rates update (e.g. cache invalidation).
+
+        Updates made by other processes sharing db_path are noticed within
+        rates_check_interval seconds.
+        """
+        self.update_listeners.append(listener)
+
+    def rates_version(self) -> Optional[int]:
+        """Timestamp of the newest stored rates; changes whenever any process updates them."""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                return conn.execute("SELECT MAX(timestamp) FROM exchange_rates").fetchone()[0]
+        except Exception as e:
+            logger.error(f"Error reading rates version: {e}")
+            return None
+
+    def check_for_updates(self):
+        """Notify listeners if another process stored newer rates since the last check."""
+        version = self.rates_version()
+        if version is None or version == self._rates_version:
+            return
+        logger.info(f"Exchange rates changed in {self.db_path} (timestamp {self._rates_version} -> {version})")
+        self._rates_version = version
+        self._notify_update_listeners()
+
+    def _notify_update_listeners(self):
+        for listener in self.update_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Error in rates update listener: {e}")
+
     def schedule_update(self):
         """Schedule automatic database update every 12 hours."""
         try:
             self.scheduler.add_job(self.update_rates, 'interval', hours=12)
+            if self.rates_check_interval > 0:
+                self.scheduler.add_job(self.check_for_updates, 'interval', seconds=self.rates_check_interval)
             self.scheduler.start()
             logger.info("Scheduler started for 12-hour updates")
             atexit.register(self._shutdown_scheduler)
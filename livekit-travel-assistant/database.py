@@ -1,14 +1,21 @@
 import sqlite3
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional, Tuple
 from config import DB_PATH
+from response_cache import ResponseCache
+from history_writer import HistoryWriter
+from db_connection import ConnectionManager
 
 logger = logging.getLogger(__name__)
 
+# One tuned, reusable connection per thread instead of connect/close per call
+connections = ConnectionManager(DB_PATH)
+
 def init_query_db():
     """Initialize the query history database."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connections.get()
         c = conn.cursor()
         c.execute('''
             CREATE TABLE IF NOT EXISTS query_history (
@@ -18,59 +25,85 @@ def init_query_db():
                 model_type TEXT NOT NULL,
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                 date TEXT,
-                query_count INTEGER DEFAULT 1
+                query_count INTEGER DEFAULT 1,
+                tool_name TEXT
             )
         ''')
+        # Older databases predate the tool_name column used for per-tool cache TTLs
+        c.execute("PRAGMA table_info(query_history);")
+        if "tool_name" not in [info[1] for info in c.fetchall()]:
+            c.execute("ALTER TABLE query_history ADD COLUMN tool_name TEXT")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_query ON query_history (query)")
         conn.commit()
         logger.info("Query history database initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
         raise
-    finally:
-        conn.close()
+
+def _to_epoch(value) -> float:
+    """Convert a stored timestamp (epoch seconds or SQLite UTC DATETIME text) to epoch seconds."""
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+def _lookup_query(query: str, is_fresh: Callable[[Optional[str], float], bool]) -> Optional[Tuple[str, Optional[str], float]]:
+    """SQLite tier of the response cache: newest stored response for query, if still fresh."""
+    c = connections.get().cursor()
+    c.execute('''
+        SELECT response, tool_name, timestamp FROM query_history
+        WHERE query = ?
+        ORDER BY timestamp DESC LIMIT 1
+    ''', (query,))
+    result = c.fetchone()
+    if not result:
+        return None
+    response, tool_name, timestamp = result
+    stored_at = _to_epoch(timestamp)
+    if not is_fresh(tool_name, stored_at):
+        return None
+    return response, tool_name, stored_at
+
+# In-process LRU tier in front of query_history, with per-tool TTLs
+response_cache = ResponseCache(backend=_lookup_query)
 
 def check_cache(query: str) -> str:
     """Check if a query is in the cache and return the response if not expired."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        one_hour_ago = datetime.now() - timedelta(hours=1)
-        c.execute('''
-            SELECT response FROM query_history 
-            WHERE query = ? AND timestamp > ?
-            ORDER BY timestamp DESC LIMIT 1
-        ''', (query, one_hour_ago))
-        result = c.fetchone()
-        if result:
+        response = response_cache.get(query)
+        if response:
             logger.info(f"Cache hit for query: {query}")
-            return result[0]
+            return response
         return ""
     except Exception as e:
         logger.error(f"Error checking cache: {e}")
         return ""
-    finally:
-        conn.close()
 
-def store_query_response(query: str, response: str, model_type: str, date: str = None, query_count: int = 1):
-    """Store query and response in the database."""
+def _write_query_batch(conn: sqlite3.Connection, batch):
+    conn.executemany('''
+        INSERT INTO query_history (query, response, model_type, date, query_count, tool_name) 
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', batch)
+
+# Background writer batching query_history inserts into one transaction
+history_writer = HistoryWriter(DB_PATH, _write_query_batch, connect=connections.get)
+
+def store_query_response(query: str, response: str, model_type: str, date: str = None, query_count: int = 1, tool_name: str = None):
+    """Store query and response in the database (written in the background)."""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO query_history (query, response, model_type, date, query_count) 
-            VALUES (?, ?, ?, ?, ?)
-        ''', (query, response, model_type, date or datetime.now().strftime('%Y-%m-%d'), query_count))
-        conn.commit()
+        history_writer.submit((query, response, model_type, date or datetime.now().strftime('%Y-%m-%d'), query_count, tool_name))
+        response_cache.put(query, response, tool_name)
         logger.info(f"Stored query: {query}")
     except Exception as e:
         logger.error(f"Error storing query: {e}")
-    finally:
-        conn.close()
 
 def cleanup_old_entries():
     """Remove entries older than 24 hours from the database."""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connections.get()
         c = conn.cursor()
         one_day_ago = datetime.now() - timedelta(days=1)
         c.execute('''
@@ -80,6 +113,4 @@ def cleanup_old_entries():
         conn.commit()
         logger.info(f"Cleaned up {c.rowcount} old entries from database")
     except Exception as e:
-        logger.error(f"Error cleaning up database: {e}")
-    finally:
-        conn.close()
\ No newline at end of file
+        logger.error(f"Error cleaning up database: {e}")
\ No newline at end of file
@@ -0,0 +1,69 @@
+import logging
+import sqlite3
+import threading
+import weakref
+from typing import Dict
+from config import SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_CACHED_STATEMENTS
+
+logger = logging.getLogger(__name__)
+
+class ConnectionManager:
+    """Hands out one reusable, tuned SQLite connection per thread.
+
+    Pragmas are applied once when a thread's connection is opened. Because the
+    connection lives on, sqlite3's per-connection statement cache keeps
+    prepared statements for repeated SQL text. A connection is closed when its
+    thread ends, so servers that start a thread per request do not leak them.
+    """
+
+    def __init__(self, db_path: str, mmap_size: int = SQLITE_MMAP_SIZE, cache_size_kb: int = SQLITE_CACHE_SIZE_KB,
+                 cached_statements: int = SQLITE_CACHED_STATEMENTS):
+        self.db_path = db_path
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections: Dict[int, weakref.finalize] = {}
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, cached_statements=self.cached_statements, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        # Negative cache_size is in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        logger.debug(f"Opened SQLite connection to {self.db_path} for {threading.current_thread().name}")
+        return conn
+
+    def get(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            # Runs when the thread object is collected after the thread exits, or from close_all
+            finalizer = weakref.finalize(threading.current_thread(), self._close, id(conn), conn)
+            with self._lock:
+                self._connections[id(conn)] = finalizer
+        return conn
+
+    def _close(self, key: int, conn: sqlite3.Connection):
+        with self._lock:
+            self._connections.pop(key, None)
+        try:
+            conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing SQLite connection: {e}")
+
+    def open_connections(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+    def close_all(self):
+        with self._lock:
+            finalizers = list(self._connections.values())
+        for finalizer in finalizers:
+            finalizer()
+        self._local = threading.local()
@@ -0,0 +1,106 @@
+import json
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tool parameters that update the session's entities, per tool
+ENTITY_PARAMETERS = {
+    "get_weather": {"location": "location"},
+    "get_attractions": {"location": "location"},
+    "get_time": {"location": "location"},
+    # The destination is what "there" refers to after a flight search
+    "get_flights": {"from_location": "origin", "to_location": "destination"},
+    "get_currency_conversion": {"from_cur": "from_currency", "to_cur": "to_currency"},
+}
+# Tool results that mean the parameters did not name a real place or currency
+FAILED_RESULTS = ("Location not found", "Couldn't find", "Error", "Currency conversion failed", "Invalid")
+
+# A place the user refers back to; "there" may carry its own preposition
+REFERENCE = re.compile(r"\b(?:(?P<prep>to|in|at|from|near|around)\s+)?(?P<ref>there|that city|the city|that place|the same place)\b", re.I)
+# Words after which a bare "there" means a destination ("fly there") rather than a place ("weather there")
+MOTION_WORDS = {"go", "going", "get", "getting", "fly", "flying", "travel", "traveling", "travelling", "flights", "flight", "trip"}
+# Other words after which a bare "there" names a place ("weather there", "what's it like there")
+PLACE_WORDS = {"weather", "attractions", "sights", "time", "like", "hotels", "stay", "staying", "visit", "visiting"}
+# "Are there any...", "there is": existential, not a place
+EXISTENTIAL = re.compile(r"\s*(?:is|are|was|were|will|isn't|aren't|any|some|'s|'re)\b", re.I)
+
+def merge_entities(current: Optional[Dict[str, str]], update: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """LangGraph reducer for the entities channel: later values win per key."""
+    return {**(current or {}), **(update or {})}
+
+def _parameters(mapping: Dict[str, str], params: Any) -> Any:
+    """ReAct passes tool input as text: a JSON object, or the bare value of a one-parameter tool."""
+    if not isinstance(params, str):
+        return params
+    try:
+        return json.loads(params)
+    except ValueError:
+        return {next(iter(mapping)): params.strip().strip("'\"")} if len(mapping) == 1 else None
+
+def entities_from_calls(calls: Iterable[Tuple[str, Any, Any]]) -> Dict[str, str]:
+    """Entities set by (tool name, parameters, result) triples, skipping calls whose result is an error."""
+    entities: Dict[str, str] = {}
+    for name, params, result in calls:
+        mapping = ENTITY_PARAMETERS.get(name)
+        params = _parameters(mapping, params) if mapping else params
+        if not mapping or not isinstance(params, dict) or str(result).startswith(FAILED_RESULTS):
+            continue
+        for param, entity in mapping.items():
+            value = params.get(param)
+            if value:
+                entities[entity] = str(value).upper() if entity.endswith("_currency") else str(value)
+        if name == "get_flights" and params.get("to_location"):
+            entities["location"] = str(params["to_location"])
+    if entities:
+        logger.debug(f"Entity updates: {entities}")
+    return entities
+
+def _previous_word(text: str, match: "re.Match") -> str:
+    previous = re.findall(r"[\w']+", text[:match.start()])
+    return previous[-1].lower() if previous else ""
+
+def _is_reference(text: str, match: "re.Match") -> bool:
+    """Whether a REFERENCE match points back at a place, rather than "are there any" or "hello there"."""
+    if match.group("ref").lower() != "there":
+        return True
+    if EXISTENTIAL.match(text, match.end()):
+        return False
+    return bool(match.group("prep")) or _previous_word(text, match) in MOTION_WORDS | PLACE_WORDS
+
+def _references(text: str) -> List["re.Match"]:
+    return [match for match in REFERENCE.finditer(text) if _is_reference(text, match)]
+
+def has_reference(text: str) -> bool:
+    return bool(_references(text))
+
+def resolve_references(text: str, entities: Optional[Dict[str, str]]) -> Optional[str]:
+    """Replace "there"/"that city" with the session's last location.
+
+    Only a "there" after a preposition or a travel word counts ("fly there",
+    "weather there"); "are there any" and "hello there" are left alone.
+    Returns text unchanged when it has no reference, and None when it has one
+    but the session has no location yet.
+    """
+    references = _references(text)
+    if not references:
+        return text
+    location = (entities or {}).get("location")
+    if not location:
+        return None
+
+    def replace(match: "re.Match") -> str:
+        if match.group("prep"):
+            return f"{match.group('prep')} {location}"
+        if match.group("ref").lower() != "there":
+            return location
+        return f"{'to' if _previous_word(text, match) in MOTION_WORDS else 'in'} {location}"
+
+    parts, end = [], 0
+    for match in references:
+        parts.extend([text[end:match.start()], replace(match)])
+        end = match.end()
+    resolved = "".join(parts) + text[end:]
+    logger.info(f"Resolved {text!r} to {resolved!r}")
+    return resolved
@@ -0,0 +1,137 @@
+# fast_path.py
+# Deterministic parser for formulaic requests ("weather in Tokyo", "convert 100 USD to EUR")
+# that maps them straight to a tool call, so they skip LLM generation entirely.
+# Usage: python3 fast_path.py [db_path]   replays query_history and reports hit rate/accuracy
+
+import logging
+import re
+import sqlite3
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Optional politeness and filler around the request
+_LEAD = r"^(?:(?:hey|hi|ok|okay|please|so)[,\s]+)*(?:(?:can|could|would) you |please |i want to |i'd like to |i need to )?(?:tell me |show me |give me |find me |get me |check )?"
+_TAIL = r"(?:\s+(?:please|today|now|right now|tonight|currently))*\s*[?.!]*$"
+_PLACE = r"(?P<{}>[a-z][a-z .'\-]*?)"
+
+def _pattern(body: str) -> "re.Pattern":
+    return re.compile(_LEAD + body + _TAIL, re.I)
+
+# (tool name, compiled pattern); named groups become the tool parameters
+PATTERNS: List[Tuple[str, "re.Pattern"]] = [
+    ("update_currency_rates", _pattern(r"(?:update|refresh) (?:the )?(?:currency |exchange )?rates")),
+    ("get_joke", _pattern(r"(?:a |another )?(?:travel |funny )?joke")),
+    ("get_currency_conversion", _pattern(
+        r"(?:convert |exchange |how much is )(?P<amount>\d[\d,]*(?:\.\d+)?) ?(?P<from_cur>[a-z]{3}) (?:to|into|in) (?P<to_cur>[a-z]{3})")),
+    ("get_weather", _pattern(r"(?:what(?:'s| is) )?(?:the )?(?:current )?weather (?:like )?(?:forecast )?(?:in|at|for) " + _PLACE.format("location"))),
+    ("get_time", _pattern(r"(?:what(?:'s| is) )?(?:the )?(?:current |local )?time (?:is it )?(?:now )?in " + _PLACE.format("location"))),
+    ("get_time", _pattern(r"what time is it in " + _PLACE.format("location"))),
+    ("get_flights", _pattern(r"(?:find |search (?:for )?|book |look for |any )?(?:a |cheap )?flights? from " + _PLACE.format("from_location")
+                             + r" to " + _PLACE.format("to_location"))),
+    ("get_attractions", _pattern(r"(?:the )?(?:top |best |main )?(?:tourist )?(?:attractions|sights|things to do|places to visit|landmarks) (?:in|at|around) "
+                                 + _PLACE.format("location"))),
+]
+
+# A location that only makes sense with chat history has to go to the LLM
+CONTEXT_WORDS = {"there", "here", "it", "that", "that city", "the city", "same place"}
+# So does a "location" that is really a second request ("Tokyo and flights to Paris")
+COMPOUND = re.compile(r"\b(?:and|then|also|plus|from|to|with|or)\b", re.I)
+# And a place followed by a date ("Paris tomorrow"): the tools only answer for now
+TIME_WORDS = re.compile(r"\b(?:today|tomorrow|tonight|yesterday|next|this|last|weekend|week|month|morning|afternoon|evening|"
+                        r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|\d+)\b", re.I)
+
+class FastPathParser:
+    """Maps formulaic inputs to {"name", "parameters"} tool calls, or None to fall through to the LLM."""
+
+    def __init__(self, patterns: List[Tuple[str, "re.Pattern"]] = None):
+        self.patterns = patterns or PATTERNS
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _parameters(match: "re.Match") -> Optional[Dict[str, Any]]:
+        params: Dict[str, Any] = {}
+        for key, value in match.groupdict().items():
+            value = value.strip(" .'-")
+            if key == "amount":
+                params[key] = float(value.replace(",", ""))
+            elif key.endswith("_cur"):
+                params[key] = value.upper()
+            else:
+                if value.lower() in CONTEXT_WORDS or COMPOUND.search(value) or TIME_WORDS.search(value):
+                    return None
+                # Users type "tokyo"; the tools and the LLM path use "Tokyo"
+                params[key] = value.title() if value.islower() else value
+        return params
+
+    def parse(self, text: str, record: bool = True) -> Optional[Dict[str, Any]]:
+        text = " ".join(text.split())
+        tool_call = None
+        for name, pattern in self.patterns:
+            match = pattern.match(text)
+            if match:
+                params = self._parameters(match)
+                if params is not None:
+                    tool_call = {"name": name, "parameters": params}
+                break
+        if record:
+            with self._lock:
+                if tool_call:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        if tool_call:
+            logger.info(f"Fast path matched {text!r} to {tool_call}")
+        return tool_call
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+    def evaluate(self, rows: Iterable[Tuple[str, Optional[str]]]) -> Dict[str, Any]:
+        """Replay (query, tool_name) rows; a hit is correct when it names the tool that answered the row.
+
+        Rows answered by several tools or none only count against the parser when it matched them.
+        """
+        total = hits = labelled_hits = correct = false_positives = 0
+        mismatches = []
+        for query, tool_name in rows:
+            total += 1
+            tool_call = self.parse(query, record=False)
+            if not tool_call:
+                continue
+            hits += 1
+            if not tool_name or tool_name == "none" or "," in tool_name:
+                false_positives += tool_name == "none"
+                continue
+            labelled_hits += 1
+            if tool_call["name"] == tool_name:
+                correct += 1
+            elif len(mismatches) < 20:
+                mismatches.append({"query": query, "expected": tool_name, "parsed": tool_call["name"]})
+        return {
+            "rows": total,
+            "hits": hits,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "accuracy": round(correct / labelled_hits, 3) if labelled_hits else 0.0,
+            "matched_plain_text_rows": false_positives,
+            "mismatches": mismatches,
+        }
+
+# Shared by hybrid_rasa_llm.py and agent.py
+fast_path = FastPathParser()
+
+def replay_query_history(db_path: str) -> Dict[str, Any]:
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT query, tool_name FROM query_history").fetchall()
+    return fast_path.evaluate(rows)
+
+if __name__ == "__main__":
+    import json
+    from config import DB_PATH
+    print(json.dumps(replay_query_history(sys.argv[1] if len(sys.argv) > 1 else DB_PATH), indent=2))
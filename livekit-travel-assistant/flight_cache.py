@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from time import time
+from typing import Any, Dict, Optional, Tuple
+import http_client
+from async_http import get_json
+from amadeus_token import amadeus_tokens
+from config import FLIGHT_CACHE_TTL, FLIGHT_CACHE_MAX_ENTRIES, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
+
+FLIGHT_OFFERS_URL = "https://test.api.amadeus.com/v2/shopping/flight-offers"
+# How long a coalesced caller waits for the search it joined
+WAIT_TIMEOUT = (HTTP_CONNECT_TIMEOUT + HTTP_READ_TIMEOUT) * (HTTP_MAX_RETRIES + 1)
+
+SearchKey = Tuple[str, str, str, int]
+
+class FlightOfferCache:
+    """TTL cache of Amadeus flight-offers responses keyed by (origin, destination, date, adults).
+
+    Identical searches that arrive while one is already running wait for that
+    request instead of sending their own. Sync callers (search) and async callers
+    (asearch) share the same entries and in-flight requests. Error responses are
+    handed to every waiting caller but never cached.
+    """
+
+    def __init__(self, ttl: int = FLIGHT_CACHE_TTL, max_entries: int = FLIGHT_CACHE_MAX_ENTRIES, get_token=None, invalidate_token=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.get_token = get_token or amadeus_tokens.get_token
+        self.invalidate_token = invalidate_token or amadeus_tokens.invalidate
+        self._entries: "OrderedDict[SearchKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[SearchKey, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(origin: str, destination: str, departure_date: str, adults: int = 1) -> SearchKey:
+        return origin.upper(), destination.upper(), str(departure_date), int(adults)
+
+    @staticmethod
+    def _params(key: SearchKey) -> Dict[str, Any]:
+        origin, destination, departure_date, adults = key
+        return {
+            "originLocationCode": origin,
+            "destinationLocationCode": destination,
+            "departureDate": departure_date,
+            "adults": adults
+        }
+
+    @staticmethod
+    def _unauthorized(response: Any) -> bool:
+        """Whether Amadeus rejected the access token (revoked or expired early)."""
+        errors = response.get("errors") if isinstance(response, dict) else None
+        return bool(errors) and any(isinstance(error, dict) and str(error.get("status")) == "401" for error in errors)
+
+    def _fetch(self, key: SearchKey) -> Dict[str, Any]:
+        """GET the offers, replacing the token and retrying once if Amadeus answers 401."""
+        token = self.get_token()
+        for attempt in range(2):
+            response = http_client.get(FLIGHT_OFFERS_URL, params=self._params(key), headers={"Authorization": f"Bearer {token}"})
+            body = response.json()
+            if attempt or not (response.status_code == 401 or self._unauthorized(body)):
+                return body
+            token = self.invalidate_token(token)
+        return body
+
+    async def _afetch(self, key: SearchKey) -> Dict[str, Any]:
+        token = await asyncio.to_thread(self.get_token)
+        for attempt in range(2):
+            body = await get_json(FLIGHT_OFFERS_URL, params=self._params(key), headers={"Authorization": f"Bearer {token}"})
+            if attempt or not self._unauthorized(body):
+                return body
+            token = await asyncio.to_thread(self.invalidate_token, token)
+        return body
+
+    def _begin(self, key: SearchKey) -> Tuple[Optional[Dict[str, Any]], Optional[Future], bool]:
+        """Return (cached response, in-flight future, whether the caller must fetch)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time() - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1], None, False
+                del self._entries[key]
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            self.misses += 1
+            future = Future()
+            self._inflight[key] = future
+            return None, future, True
+
+    def _finish(self, key: SearchKey, future: Future, response: Optional[Dict[str, Any]] = None,
+                error: Optional[BaseException] = None):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is None and self.ttl > 0 and isinstance(response, dict) and "errors" not in response:
+                self._entries[key] = (time(), response)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(response)
+
+    def search(self, origin: str, destination: str, departure_date: str, adults: int = 1) -> Dict[str, Any]:
+        """Return the flight-offers response for a route, from cache or a single shared request."""
+        key = self.make_key(origin, destination, departure_date, adults)
+        cached, future, leader = self._begin(key)
+        if cached is not None:
+            logger.info(f"Flight cache hit for {key}")
+            return cached
+        if not leader:
+            logger.info(f"Joining in-flight flight search for {key}")
+            return future.result(WAIT_TIMEOUT)
+        try:
+            response = self._fetch(key)
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, response)
+        return response
+
+    async def asearch(self, origin: str, destination: str, departure_date: str, adults: int = 1) -> Dict[str, Any]:
+        """Async variant of search, sharing the same cache and in-flight requests."""
+        key = self.make_key(origin, destination, departure_date, adults)
+        cached, future, leader = self._begin(key)
+        if cached is not None:
+            logger.info(f"Flight cache hit for {key}")
+            return cached
+        if not leader:
+            logger.info(f"Joining in-flight flight search for {key}")
+            return await asyncio.wait_for(asyncio.wrap_future(future), WAIT_TIMEOUT)
+        try:
+            response = await self._afetch(key)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, response)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "in_flight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            }
+
+# Shared by tools.py, hybrid_rasa_llm.py and the Rasa actions
+flight_offers = FlightOfferCache()
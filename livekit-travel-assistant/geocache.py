@@ -0,0 +1,151 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+from time import time
+from typing import Dict, Optional
+from geopy.geocoders import Nominatim
+from config import GEOCODE_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+GeoPoint = namedtuple("GeoPoint", ["latitude", "longitude", "address"])
+
+# Common alternate names, keyed and valued by normalized place name
+DEFAULT_ALIASES = {
+    "nyc": "new york",
+    "new york city": "new york",
+    "la": "los angeles",
+    "sf": "san francisco",
+    "bombay": "mumbai",
+    "delhi": "new delhi",
+    "calcutta": "kolkata",
+    "madras": "chennai",
+    "bengaluru": "bangalore",
+    "peking": "beijing",
+    "saigon": "ho chi minh city",
+}
+
+# How long a failed lookup is remembered (in memory only) before Nominatim is asked again
+NEGATIVE_TTL = 3600
+
+class GeocodeCache:
+    """Geocoder with a persistent SQLite cache shared by the Flask tools and Rasa actions.
+
+    Drop-in replacement for Nominatim(...).geocode: returns an object with
+    latitude/longitude/address, or None if the place cannot be found.
+    """
+
+    def __init__(self, db_path: str = GEOCODE_DB_PATH, user_agent: str = "travel_assistant", geolocator=None):
+        self.db_path = db_path
+        self.geolocator = geolocator or Nominatim(user_agent=user_agent)
+        self._memory: Dict[str, GeoPoint] = {}
+        self._misses: Dict[str, float] = {}
+        self._aliases: Dict[str, str] = dict(DEFAULT_ALIASES)
+        self._lock = threading.Lock()
+        self.init_db()
+
+    def init_db(self):
+        """Create the geocode cache tables and load stored aliases."""
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS geocode_cache (
+                        place TEXT PRIMARY KEY,
+                        latitude REAL NOT NULL,
+                        longitude REAL NOT NULL,
+                        address TEXT,
+                        timestamp INTEGER
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS geocode_aliases (
+                        alias TEXT PRIMARY KEY,
+                        place TEXT NOT NULL
+                    )
+                """)
+                conn.commit()
+                cursor.execute("SELECT alias, place FROM geocode_aliases")
+                self._aliases.update(dict(cursor.fetchall()))
+            logger.info("Geocode cache database initialized successfully")
+        except Exception as e:
+            logger.error(f"Error initializing geocode cache: {e}")
+
+    @staticmethod
+    def normalize(place: str) -> str:
+        """Lowercase, drop punctuation and collapse whitespace: ' New-York, ' -> 'new york'."""
+        place = re.sub(r"[^\w\s]", " ", place.lower())
+        return " ".join(place.split())
+
+    def resolve_alias(self, place: str) -> str:
+        key = self.normalize(place)
+        return self._aliases.get(key, key)
+
+    def add_alias(self, alias: str, place: str):
+        """Persist an alternate name for a place, e.g. add_alias("Big Apple", "New York")."""
+        alias_key, place_key = self.normalize(alias), self.resolve_alias(place)
+        if not alias_key or alias_key == place_key:
+            return
+        with self._lock:
+            self._aliases[alias_key] = place_key
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("INSERT OR REPLACE INTO geocode_aliases (alias, place) VALUES (?, ?)",
+                             (alias_key, place_key))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error storing geocode alias: {e}")
+
+    def _load(self, key: str) -> Optional[GeoPoint]:
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute(
+                    "SELECT latitude, longitude, address FROM geocode_cache WHERE place = ?", (key,)
+                ).fetchone()
+            return GeoPoint(*row) if row else None
+        except Exception as e:
+            logger.error(f"Error reading geocode cache: {e}")
+            return None
+
+    def _save(self, key: str, point: GeoPoint):
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO geocode_cache (place, latitude, longitude, address, timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (key, point.latitude, point.longitude, point.address, int(time())))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error writing geocode cache: {e}")
+
+    def geocode(self, place: str) -> Optional[GeoPoint]:
+        """Geocode a place name, consulting memory, then disk, then Nominatim."""
+        if not place:
+            return None
+        key = self.resolve_alias(place)
+        with self._lock:
+            point = self._memory.get(key)
+            if point:
+                return point
+            if time() - self._misses.get(key, 0) < NEGATIVE_TTL:
+                return None
+
+        point = self._load(key)
+        if point is None:
+            location = self.geolocator.geocode(place if key == self.normalize(place) else key)
+            if not location:
+                with self._lock:
+                    self._misses[key] = time()
+                logger.info(f"Geocode miss for {place}")
+                return None
+            point = GeoPoint(location.latitude, location.longitude, getattr(location, "address", None))
+            self._save(key, point)
+            logger.info(f"Geocoded {place} via Nominatim")
+        with self._lock:
+            self._memory[key] = point
+            self._misses.pop(key, None)
+        return point
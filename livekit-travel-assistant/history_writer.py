@@ -0,0 +1,106 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+from time import time
+from typing import Any, Callable, List, Optional
+from config import HISTORY_FLUSH_INTERVAL, HISTORY_MAX_BATCH
+
+logger = logging.getLogger(__name__)
+
+class HistoryWriter:
+    """Write-behind queue that groups query_history writes into one transaction.
+
+    Pending items are written by a background thread every flush_interval
+    seconds, or as soon as max_batch items are queued. write_batch(conn, items)
+    does the actual SQL inside that transaction. The database is switched to WAL
+    so readers are never blocked by the writer; pending writes are flushed at exit.
+    """
+
+    def __init__(self, db_path: str, write_batch: Callable[[sqlite3.Connection, List[Any]], None],
+                 flush_interval: float = HISTORY_FLUSH_INTERVAL, max_batch: int = HISTORY_MAX_BATCH,
+                 connect: Optional[Callable[[], sqlite3.Connection]] = None):
+        self.db_path = db_path
+        self.write_batch = write_batch
+        self.connect = connect
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, item: Any):
+        """Queue one write; returns immediately."""
+        if self._stopped:
+            self._write([item])
+            return
+        self._queue.put(item)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued so far has been committed."""
+        if self._stopped:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self):
+        """Flush pending writes and stop the writer thread."""
+        if self._stopped:
+            return
+        self.flush(timeout=10)
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None and self.connect is not None:
+            self._conn = self.connect()
+        elif self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
+
+    def _write(self, batch: List[Any]):
+        if not batch:
+            return
+        start = time()
+        try:
+            conn = self._connect()
+            with conn:
+                self.write_batch(conn, batch)
+            logger.info(f"Wrote {len(batch)} query_history rows in {time() - start:.3f} seconds")
+        except Exception as e:
+            logger.error(f"Error writing query_history batch of {len(batch)}: {e}")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch, waiters = [], []
+            deadline = time() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+                if len(batch) >= self.max_batch:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(deadline - time(), 0))
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+        if self._conn is not None and self.connect is None:
+            self._conn.close()
@@ -0,0 +1,91 @@
+import logging
+import threading
+from time import time
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+from config import (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_RETRIES, HTTP_POOL_MAXSIZE,
+                    HTTP_RETRY_BUDGET_RATIO, HTTP_RETRY_BUDGET_MIN)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+class RetryBudget:
+    """Limits retries to a fraction of recent requests so a failing upstream is not hammered."""
+
+    def __init__(self, ratio: float = HTTP_RETRY_BUDGET_RATIO, min_retries: int = HTTP_RETRY_BUDGET_MIN, window: int = 60):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._lock = threading.Lock()
+        self._window_start = time()
+        self._requests = 0
+        self._retries = 0
+
+    def _roll(self):
+        if time() - self._window_start >= self.window:
+            self._window_start = time()
+            self._requests = 0
+            self._retries = 0
+
+    def record_request(self):
+        with self._lock:
+            self._roll()
+            self._requests += 1
+
+    def acquire(self) -> bool:
+        """Take one retry from the budget; False once the window's budget is spent."""
+        with self._lock:
+            self._roll()
+            if self._retries >= max(self.min_retries, int(self._requests * self.ratio)):
+                return False
+            self._retries += 1
+            return True
+
+retry_budget = RetryBudget()
+
+class BudgetedRetry(Retry):
+    """urllib3 Retry that also draws each retry from the shared RetryBudget."""
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        new_retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        if not retry_budget.acquire():
+            logger.warning(f"Retry budget exhausted, not retrying {url}")
+            raise MaxRetryError(_pool, url, error or ResponseError("retry budget exhausted"))
+        return new_retry
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Shared keep-alive session; urllib3 keeps a connection pool per host."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                retries = BudgetedRetry(
+                    total=HTTP_MAX_RETRIES,
+                    backoff_factor=0.3,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retries)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def request(method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+    """Send a request through the shared session with the default (connect, read) timeouts."""
+    retry_budget.record_request()
+    return get_session().request(method, url, timeout=timeout or DEFAULT_TIMEOUT, **kwargs)
+
+def get(url: str, params=None, timeout=None, **kwargs) -> requests.Response:
+    return request("GET", url, params=params, timeout=timeout, **kwargs)
+
+def post(url: str, data=None, json=None, timeout=None, **kwargs) -> requests.Response:
+    return request("POST", url, data=data, json=json, timeout=timeout, **kwargs)
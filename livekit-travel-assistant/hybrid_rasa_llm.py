@@ -1,26 +1,43 @@
-from flask import Flask, request, jsonify
-from langchain_core.messages import HumanMessage, AIMessage
+from flask import Flask, Response, request, jsonify
+from langchain_core.messages import HumanMessage, AIMessage, RemoveMessage
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages
 from langchain_core.tools import tool
 from dotenv import load_dotenv
-import requests
-from geopy.geocoders import Nominatim
+import http_client
+import async_tools
 from datetime import datetime, date
 import os
+import sys
+import signal
 import json
 import re
 import sqlite3
 import logging
-from langchain_community.llms import LlamaCpp
-from typing import Dict, List, Any, Optional
+from typing import Annotated, Callable, Dict, List, Any, Optional, Tuple
 from langchain_core.prompts import PromptTemplate
-from functools import lru_cache
 from time import time
 import random
 from currency_converter import CurrencyConverter
-from langgraph.checkpoint.memory import MemorySaver
-from fuzzywuzzy import fuzz
+from geocache import GeocodeCache
+from flight_cache import flight_offers
+from airport_index import airport_index
+from session_store import SessionCheckpointer
+from conversation_window import split_window, fold_summary, render_history
+from entity_memory import merge_entities, entities_from_calls, resolve_references
+from query_index import FuzzyQueryIndex
+from response_cache import ResponseCache
+from history_writer import HistoryWriter
+from inference_scheduler import InferenceScheduler, SchedulerOverloaded
+from prefix_cache import PrefixCache
+from model_loader import context_pool
+from config import MODEL_WARMUP, SPECULATIVE_DECODING, CURRENCY_RATES_CHECK_INTERVAL
+from speculative import speculative_stats, timed_generation
+from model_router import ModelRouter, RouteDecision, user_turn
+from fast_path import fast_path
+from tool_grammar import ToolGrammar
 import time as time_module
+import uuid
 
 # Set up logging
 logging.basicConfig(
@@ -38,8 +55,6 @@ load_dotenv()
 
 # Access API Keys from .env
 OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
-AMADEUS_API_KEY = os.getenv("AMADEUS_API_KEY")
-AMADEUS_API_SECRET = os.getenv("AMADEUS_API_SECRET")
 EXCHANGERATE_API_KEY = os.getenv("EXCHANGERATE_API_KEY")
 GEOAPIFY_API_KEY = os.getenv("GEOAPIFY_API_KEY")
 TIMEZONEDB_API_KEY = os.getenv("TIMEZONEDB_API_KEY")
@@ -47,11 +62,11 @@ TIMEZONEDB_API_KEY = os.getenv("TIMEZONEDB_API_KEY")
 # Initialize Flask app
 app = Flask(__name__)
 
-# Initialize geolocator
-geolocator = Nominatim(user_agent="travel_assistant")
+# Initialize geolocator (persistent geocode cache shared with the Rasa actions)
+geolocator = GeocodeCache()
 
 # Initialize CurrencyConverter
-currency_converter = CurrencyConverter(access_key=EXCHANGERATE_API_KEY)
+currency_converter = CurrencyConverter(access_key=EXCHANGERATE_API_KEY, rates_check_interval=CURRENCY_RATES_CHECK_INTERVAL)
 
 # Initialize SQLite database for query history
 def init_query_db(db_path="query_history.db"):
@@ -70,6 +85,8 @@ def init_query_db(db_path="query_history.db"):
                 )
             """)
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_query ON query_history (query)")
+            # WAL lets cache reads proceed while the history writer commits
+            cursor.execute("PRAGMA journal_mode=WAL")
             conn.commit()
         logger.info("Query history database initialized successfully")
     except Exception as e:
@@ -87,63 +104,98 @@ model_3b_path = os.path.expanduser("~/.llama/checkpoints/Llama3.2-3B-Instruct.gg
 if not os.path.exists(model_1b_path) or not os.path.exists(model_3b_path):
     raise FileNotFoundError(f"Model files not found: {model_1b_path}, {model_3b_path}")
 
-# Load Llama models with LlamaCpp
-try:
-    llm_1b = LlamaCpp(
-        model_path=model_1b_path,
-        n_ctx=1024,
-        n_gpu_layers=50,
-        temperature=0.1,
-        max_tokens=1000,
-        verbose=True,
-        stop=["\n", "Please", "<|eot_id|>", "Result:", "Note:", "This is", ";"]
-    )
-    llm_3b = LlamaCpp(
-        model_path=model_3b_path,
-        n_ctx=1024,
-        n_gpu_layers=50,
-        temperature=0.1,
-        max_tokens=1000,
-        verbose=True,
-        stop=["\n", "Please", "<|eot_id|>", "Result:", "Note:", "This is", ";"]
-    )
-except Exception as e:
-    logger.error(f"Error loading Llama models: {e}")
-    raise
+# LLM_CONTEXTS_PER_MODEL contexts per model over the same memory-mapped weights; each
+# loads lazily on its scheduler worker and is unloaded when idle. With speculative
+# decoding every 3B context drafts with its own 1B context.
+models = {
+    "1b": context_pool("1b", model_1b_path),
+    "3b": context_pool("3b", model_3b_path, draft_model_path=model_1b_path if SPECULATIVE_DECODING else None),
+}
 
-# Custom LLM wrapper to switch between 1B and 3B based on input length
-class DynamicLlamaCpp:
-    def __init__(self, llm_1b, llm_3b):
-        self.llm_1b = llm_1b
-        self.llm_3b = llm_3b
+# Worker threads own the model contexts; request threads queue work for them
+scheduler = InferenceScheduler(models)
+
+# Everything before this marker in prompt_template is the same for every request
+# on a given day, so its KV state is cached per model (see prefix_cache.py)
+PROMPT_INPUT_MARKER = "User input: "
 
-    def invoke(self, input, config=None, **kwargs):
+# Custom LLM wrapper that routes each turn to the 1B or 3B model (see model_router.py)
+class DynamicLlamaCpp:
+    def __init__(self, scheduler, router):
+        self.scheduler = scheduler
+        self.router = router
+        # KV snapshots of the system message/tool list prefix, kept per context of each model
+        self.prefix_caches = {"1b": PrefixCache(PROMPT_INPUT_MARKER), "3b": PrefixCache(PROMPT_INPUT_MARKER)}
+
+    @staticmethod
+    def _prompt_text(input) -> str:
         if isinstance(input, list):
-            prompt_text = "\n".join([msg.content if hasattr(msg, 'content') else str(msg) for msg in input])
-        else:
-            prompt_text = str(input)
-        
-        input_tokens = len(self.llm_1b.client.tokenize(prompt_text.encode('utf-8')))
-        selected_llm = self.llm_1b if input_tokens < 100 else self.llm_3b
-        logger.info(f"Selected model: {'1B' if input_tokens < 100 else '3B'} for {input_tokens} tokens")
+            return "\n".join([msg.content if hasattr(msg, 'content') else str(msg) for msg in input])
+        return str(input)
+
+    def _select(self, prompt_text: str, route: Optional[RouteDecision] = None) -> str:
+        # Without a decision from the caller, score only the user turn, never the system prompt
+        if route is None:
+            route = self.router.route(user_turn(prompt_text, PROMPT_INPUT_MARKER))
         logger.debug(f"Input prompt: {prompt_text}")
-        return selected_llm.invoke(prompt_text, config=config, **kwargs)
+        return route.model
+
+    def invoke(self, input, config=None, route: Optional[RouteDecision] = None, **kwargs):
+        prompt_text = self._prompt_text(input)
+        selected = self._select(prompt_text, route)
+        prefix_cache = self.prefix_caches[selected]
+
+        def generate(model):
+            prefix_cache.prepare(model.client, prompt_text)
+            # Grammars hold parse state, so each context samples with its own
+            model_kwargs = ToolGrammar.resolve(model.client, kwargs)
+            return timed_generation(model, lambda: model.invoke(prompt_text, config=config, **model_kwargs))
+        start = time_module.time()
+        try:
+            result = self.scheduler.run(selected, generate)
+        except Exception:
+            self.router.record(selected, time_module.time() - start, ok=False)
+            raise
+        self.router.record(selected, time_module.time() - start)
+        return result
+
+    def stream(self, input, route: Optional[RouteDecision] = None, **kwargs):
+        """Queue the completion and return an iterator over its text chunks."""
+        prompt_text = self._prompt_text(input)
+        selected = self._select(prompt_text, route)
+        prefix_cache = self.prefix_caches[selected]
+        start = time_module.time()
+
+        def prepare(model):
+            prefix_cache.prepare(model.client, prompt_text)
+            return ToolGrammar.resolve(model.client, kwargs)
+        chunks = self.scheduler.stream(selected, prompt_text, prepare=prepare)
+
+        def timed():
+            ok = False
+            try:
+                yield from chunks
+                ok = True
+            except GeneratorExit:
+                # Client went away; the route itself did not fail
+                ok = True
+                raise
+            finally:
+                self.router.record(selected, time_module.time() - start, ok)
+        return timed()
 
 # Initialize dynamic LLM
-llm = DynamicLlamaCpp(llm_1b=llm_1b, llm_3b=llm_3b)
+llm = DynamicLlamaCpp(scheduler=scheduler, router=ModelRouter())
 
-# Use MemorySaver for LangGraph checkpointing
-try:
-    checkpoint = MemorySaver()
-except ImportError as e:
-    logger.error(f"Failed to import MemorySaver: {e}")
-    raise ImportError("Ensure langgraph is installed with checkpointing support. Run: pip install langgraph")
+# LangGraph checkpoints per session: LRU in memory, persisted to SQLite with a TTL
+checkpoint = SessionCheckpointer()
 
 # System message with updated tools
 system_message = """You are a travel assistant. Respond EXCLUSIVELY with:
 - A single valid JSON object for tool calls: {"name": "tool_name", "parameters": {...}}
+- A single JSON list of tool call objects when the request needs several independent tools: [{"name": ...}, {"name": ...}]
 - Plain text for direct answers (e.g., for general questions like jokes).
-DO NOT include explanations, notes, simulated chat interfaces, multiple JSON objects, or extra text like 'assistant: '. DO NOT use semicolons to separate JSON objects.
+DO NOT include explanations, notes, simulated chat interfaces, several separate JSON values, or extra text like 'assistant: '. DO NOT use semicolons to separate JSON objects.
 
 Available tools and their required parameters:
 1. get_weather: {"location": "string"}
@@ -165,6 +217,8 @@ Examples of valid responses:
   Response: {"name": "get_currency_conversion", "parameters": {"amount": 100, "from_cur": "USD", "to_cur": "EUR"}}
 - User: "Update currency rates."
   Response: {"name": "update_currency_rates", "parameters": {}}
+- User: "Trip to Tokyo from London."
+  Response: [{"name": "get_weather", "parameters": {"location": "Tokyo"}}, {"name": "get_flights", "parameters": {"from_location": "London", "to_location": "Tokyo"}}, {"name": "get_attractions", "parameters": {"location": "Tokyo"}}]
 
 Invalid responses (DO NOT USE):
 - assistant: {"name": "get_weather", "parameters": {"location": "Tokyo"}}
@@ -185,7 +239,7 @@ def get_weather(location: str) -> str:
         return "Location not found. Ask for confirmation."
     url = f"https://api.openweathermap.org/data/2.5/weather?lat={loc.latitude}&lon={loc.longitude}&appid={OPENWEATHERMAP_API_KEY}&units=metric"
     try:
-        response = requests.get(url).json()
+        response = http_client.get(url).json()
         logger.debug(f"Weather API response: {response}")
         if response['cod'] != 200:
             return f"Weather data not available: {response.get('message', 'Unknown error')}"
@@ -197,58 +251,16 @@ def get_weather(location: str) -> str:
         logger.error(f"Weather API error: {e}")
         return f"Error fetching weather data: {str(e)}"
 
-# Simple IATA code mapping
-IATA_CODES = {
-    "new york": "NYC",
-    "london": "LON",
-    "new delhi": "DEL",
-    "mumbai": "BOM",
-    "paris": "PAR"
-}
-
-@lru_cache(maxsize=1)
-def get_amadeus_token():
-    """Get and cache Amadeus API token."""
-    token_url = "https://test.api.amadeus.com/v1/security/oauth2/token"
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": AMADEUS_API_KEY,
-        "client_secret": AMADEUS_API_SECRET
-    }
-    try:
-        response = requests.post(token_url, data=data).json()
-        logger.debug(f"Amadeus token response: {response}")
-        access_token = response.get("access_token")
-        if not access_token:
-            raise ValueError("Failed to authenticate with Amadeus API.")
-        return access_token, time() + response.get("expires_in", 1799)
-    except Exception as e:
-        logger.error(f"Amadeus API error: {e}")
-        raise
-
 @tool
 def get_flights(from_location: str, to_location: str) -> str:
     """Search for flights between two locations. Input: from_location, to_location."""
-    from_code = IATA_CODES.get(from_location.lower())
-    to_code = IATA_CODES.get(to_location.lower())
+    from_code = airport_index.code_for(from_location)
+    to_code = airport_index.code_for(to_location)
     if not from_code or not to_code:
-        return f"Invalid airport codes for {from_location} or {to_location}. Please use city names like 'New York' or 'London'."
+        return f"Couldn't find an airport for {from_location if not from_code else to_location}. Please use a city or airport name like 'New York' or 'Heathrow'."
     
     try:
-        access_token, expiry = get_amadeus_token()
-        if time() > expiry:
-            get_amadeus_token.cache_clear()
-            access_token, expiry = get_amadeus_token()
-        
-        url = "https://test.api.amadeus.com/v2/shopping/flight-offers"
-        params = {
-            "originLocationCode": from_code,
-            "destinationLocationCode": to_code,
-            "departureDate": date.today().isoformat(),
-            "adults": 1
-        }
-        headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get(url, params=params, headers=headers).json()
+        response = flight_offers.search(from_code, to_code, date.today().isoformat(), adults=1)
         logger.debug(f"Flights API response: {response}")
         if 'data' in response and response['data']:
             flight = response['data'][0]
@@ -268,7 +280,7 @@ def get_attractions(location: str) -> str:
         return "Location not found. Ask for confirmation."
     url = f"https://api.geoapify.com/v2/places?categories=tourism.attraction&filter=circle:{loc.longitude},{loc.latitude},10000&apiKey={GEOAPIFY_API_KEY}"
     try:
-        response = requests.get(url).json()
+        response = http_client.get(url).json()
         logger.debug(f"Attractions API response: {response}")
         attractions = [feature['properties']['name'] for feature in response['features'] if 'name' in feature['properties']][:3]
         if not attractions:
@@ -316,7 +328,7 @@ def get_time(location: str) -> str:
         return "Location not found. Ask for confirmation."
     url = f"http://api.timezonedb.com/v2.1/get-time-zone?key={TIMEZONEDB_API_KEY}&format=json&by=position&lat={loc.latitude}&lng={loc.longitude}"
     try:
-        response = requests.get(url).json()
+        response = http_client.get(url).json()
         logger.debug(f"Time API response: {response}")
         if response['status'] == 'OK':
             time = datetime.fromtimestamp(response['timestamp']).strftime('%H:%M')
@@ -336,11 +348,36 @@ def get_joke() -> str:
     ]
     return random.choice(jokes)
 
+# Async implementations, used by tool.ainvoke() when independent tool calls are fanned out
+async def _aget_weather(location: str) -> str:
+    return await async_tools.fetch_weather(location, geolocator)
+
+async def _aget_flights(from_location: str, to_location: str) -> str:
+    from_code = airport_index.code_for(from_location)
+    to_code = airport_index.code_for(to_location)
+    if not from_code or not to_code:
+        return f"Couldn't find an airport for {from_location if not from_code else to_location}. Please use a city or airport name like 'New York' or 'Heathrow'."
+    return await async_tools.fetch_flights(from_location, to_location, from_code, to_code, flight_offers)
+
+async def _aget_attractions(location: str) -> str:
+    return await async_tools.fetch_attractions(location, geolocator)
+
+async def _aget_time(location: str) -> str:
+    return await async_tools.fetch_time(location, geolocator)
+
+get_weather.coroutine = _aget_weather
+get_flights.coroutine = _aget_flights
+get_attractions.coroutine = _aget_attractions
+get_time.coroutine = _aget_time
+
 # List of tools for the agent
 tools = [get_weather, get_flights, get_attractions, get_currency_conversion, get_time, get_joke, update_currency_rates]
 tool_map = {tool.name: tool for tool in tools}
 
-# Prompt template
+# Constrains generation to these tools' call JSON or one line of text
+tool_grammar = ToolGrammar(tools)
+
+# Prompt template (see PROMPT_INPUT_MARKER)
 prompt_template = PromptTemplate.from_template(
     """{system_message}
 
@@ -354,47 +391,100 @@ Chat history: {history}
 
 # Define state for the agent
 class AgentState(Dict):
-    messages: List[Any]
+    # Appended to per turn; the compact node folds turns that no longer fit the prompt into summary
+    messages: Annotated[List[Any], add_messages]
+    summary: str
+    # Last location, flight origin/destination and currencies, updated from successful tool calls
+    entities: Annotated[Dict[str, str], merge_entities]
+    # Intent confidence of the Rasa turn that fell back to /llm, if the caller sent it
+    rasa_confidence: Optional[float]
+
+# In-memory fuzzy indexes over query_history, one per database file
+query_indexes: Dict[str, FuzzyQueryIndex] = {}
+# LRU response caches in front of each index, with per-tool TTLs
+response_caches: Dict[str, ResponseCache] = {}
+
+def get_query_index(db_path: str = "query_history.db") -> FuzzyQueryIndex:
+    index = query_indexes.get(db_path)
+    if index is None:
+        index = FuzzyQueryIndex()
+        index.load(db_path)
+        query_indexes[db_path] = index
+    return index
+
+def get_response_cache(db_path: str = "query_history.db") -> ResponseCache:
+    cache = response_caches.get(db_path)
+    if cache is None:
+        def lookup_index(query, is_fresh, max_age_hours=None, similarity_threshold=90):
+            min_timestamp = int(time()) - max_age_hours * 3600 if max_age_hours else 0
+            match = get_query_index(db_path).search(
+                query,
+                similarity_threshold=similarity_threshold,
+                min_timestamp=min_timestamp,
+                is_fresh=lambda entry: is_fresh(entry["tool_name"], entry["timestamp"])
+            )
+            if not match:
+                return None
+            cached_query, entry = match
+            logger.debug(f"Fuzzy index matched {query} to {cached_query}")
+            return entry["response"], entry["tool_name"], entry["timestamp"]
+        cache = ResponseCache(backend=lookup_index)
+        response_caches[db_path] = cache
+    return cache
+
+# Expire cached conversions whenever the exchange rates change, in this or another process
+currency_converter.add_update_listener(lambda: get_response_cache().invalidate_tool("get_currency_conversion"))
 
 # Function to check cache for recent responses with fuzzy matching
-def check_cache(query: str, db_path: str = "query_history.db", max_age_hours: int = 24, similarity_threshold: int = 90) -> Optional[str]:
+def check_cache(query: str, db_path: str = "query_history.db", max_age_hours: Optional[int] = None, similarity_threshold: int = 90) -> Optional[str]:
+    """Check the LRU tier, then the fuzzy query_history index; TTLs are per tool_name."""
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT query, response FROM query_history 
-                WHERE timestamp > ? 
-                ORDER BY timestamp DESC
-            """, (int(time()) - max_age_hours * 3600,))
-            results = cursor.fetchall()
-            for cached_query, response in results:
-                if fuzz.ratio(query.lower(), cached_query.lower()) >= similarity_threshold:
-                    logger.info(f"Cache hit for query: {query} (matched: {cached_query})")
-                    return response
+        response = get_response_cache(db_path).get(query, max_age_hours=max_age_hours, similarity_threshold=similarity_threshold)
+        if response is None:
             logger.info(f"Cache miss for query: {query}")
-            return None
+        else:
+            logger.info(f"Cache hit for query: {query}")
+        return response
     except Exception as e:
         logger.error(f"Error checking cache: {e}")
         return None
 
+# Write query_history rows in batches on a background thread
+def write_query_batch(conn: sqlite3.Connection, batch: List):
+    cursor = conn.cursor()
+    for query, response, tool_name, timestamp, day in batch:
+        # Check if query exists, increment count and keep the fresh answer (the old one may have expired)
+        cursor.execute("SELECT id, query_count FROM query_history WHERE query = ?", (query,))
+        existing = cursor.fetchone()
+        if existing:
+            cursor.execute("""
+                UPDATE query_history SET query_count = query_count + 1, response = ?, tool_name = ?, timestamp = ?, date = ?
+                WHERE id = ?
+            """, (response, tool_name, timestamp, day, existing[0]))
+        else:
+            cursor.execute("""
+                INSERT INTO query_history (query, response, tool_name, timestamp, date, query_count)
+                VALUES (?, ?, ?, ?, ?, 1)
+            """, (query, response, tool_name, timestamp, day))
+
+history_writers: Dict[str, HistoryWriter] = {}
+
+def get_history_writer(db_path: str = "query_history.db") -> HistoryWriter:
+    writer = history_writers.get(db_path)
+    if writer is None:
+        writer = HistoryWriter(db_path, write_query_batch)
+        history_writers[db_path] = writer
+    return writer
+
 # Function to store query and response in database
 def store_query_response(query: str, response: str, tool_name: str, db_path: str = "query_history.db"):
+    """Update the in-memory caches now and queue the query_history write."""
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            # Check if query exists and increment count
-            cursor.execute("SELECT id, query_count FROM query_history WHERE query = ?", (query,))
-            existing = cursor.fetchone()
-            if existing:
-                cursor.execute("UPDATE query_history SET query_count = query_count + 1, timestamp = ?, date = ? WHERE id = ?",
-                              (int(time()), datetime.now().strftime('%Y-%m-%d'), existing[0]))
-            else:
-                cursor.execute("""
-                    INSERT INTO query_history (query, response, tool_name, timestamp, date, query_count)
-                    VALUES (?, ?, ?, ?, ?, 1)
-                """, (query, response, tool_name, int(time()), datetime.now().strftime('%Y-%m-%d')))
-            conn.commit()
-            logger.info(f"Stored query: {query} with response: {response}")
+        timestamp = int(time())
+        get_history_writer(db_path).submit((query, response, tool_name, timestamp, datetime.now().strftime('%Y-%m-%d')))
+        logger.info(f"Stored query: {query} with response: {response}")
+        get_query_index(db_path).add(query, response, tool_name, timestamp)
+        get_response_cache(db_path).put(query, response, tool_name)
     except Exception as e:
         logger.error(f"Error storing query/response: {e}")
 
@@ -407,15 +497,69 @@ def cleanup_old_entries(db_path: str = "query_history.db", max_age_days: int = 3
                           (int(time()) - max_age_days * 24 * 3600,))
             conn.commit()
             logger.info(f"Cleaned up {cursor.rowcount} old entries from query_history")
+        get_query_index(db_path).prune(int(time()) - max_age_days * 24 * 3600)
     except Exception as e:
         logger.error(f"Error cleaning up database: {e}")
 
+def is_tool_call(tool_call) -> bool:
+    return isinstance(tool_call, dict) and "name" in tool_call and "parameters" in tool_call
+
+def fix_tool_call_params(tool_call: Dict):
+    """Fix incorrect parameter names for get_flights."""
+    if tool_call["name"] == "get_flights":
+        params = tool_call["parameters"]
+        if "from_city" in params:
+            params["from_location"] = params.pop("from_city")
+        if "to_city" in params:
+            params["to_location"] = params.pop("to_city")
+
+def run_parallel_tool_calls(user_input: str, tool_calls: List, tool_map, start_time: float):
+    """Run a list of independent tool calls concurrently and combine their results."""
+    if not tool_calls or not all(is_tool_call(tool_call) for tool_call in tool_calls):
+        logger.warning("Invalid tool call format")
+        return {"messages": [AIMessage(content="Invalid tool call format.")]}
+    for tool_call in tool_calls:
+        fix_tool_call_params(tool_call)
+        if tool_call["name"] not in tool_map:
+            logger.warning(f"Invalid tool name: {tool_call['name']}")
+            return {"messages": [AIMessage(content=f"Invalid tool name: {tool_call['name']}")]}
+    tool_names = [tool_call["name"] for tool_call in tool_calls]
+    logger.info(f"Invoking tools concurrently: {tool_names}")
+    results = async_tools.invoke_tools_concurrently(tool_calls, tool_map)
+    combined = " ".join(results)
+    store_query_response(user_input, combined, ",".join(tool_names))
+    response_time = time_module.time() - start_time
+    logger.info(f"Response time ({len(tool_calls)} concurrent tool calls): {response_time:.2f} seconds")
+    entities = entities_from_calls((tool_call["name"], tool_call["parameters"], result) for tool_call, result in zip(tool_calls, results))
+    return {"messages": [AIMessage(content=combined)], "entities": entities}
+
+def build_prompt(messages: List[Any], tools, summary: str = "", user_input: Optional[str] = None) -> str:
+    """Format the prompt with the recent turns that fit LLM_HISTORY_TOKENS and a summary of the rest.
+
+    user_input replaces the last message as the input line, e.g. with its references resolved.
+    """
+    older, recent = split_window(messages)
+    history = render_history(fold_summary(summary, older) if older else summary, recent)
+    tool_names = ", ".join([tool.name for tool in tools])
+    return prompt_template.format(
+        system_message=system_message,
+        tool_names=tool_names,
+        date=date.today().strftime('%d %b %Y'),
+        input=user_input or messages[-1].content,
+        history=history
+    )
+
+def route_turn(messages: List[Any], rasa_confidence: Optional[float] = None, user_input: Optional[str] = None) -> RouteDecision:
+    """Pick the model from the user turn and recent history rather than the full prompt."""
+    history = [f"{msg.type}: {msg.content}" for msg in messages[:-1]]
+    return llm.router.route(user_input or messages[-1].content, history, rasa_confidence)
+
 # Agent node to process input and generate response
 def agent_node(state: AgentState, llm, tools, tool_map):
     start_time = time_module.time()
-    user_input = state["messages"][-1].content
-    history = "\n".join([f"{msg.type}: {msg.content}" for msg in state["messages"]])
-    tool_names = ", ".join([tool.name for tool in tools])
+    # "there" resolves from the session's entities, so the cache key, fast path and router
+    # see the full request; an unresolvable reference is left for the LLM and the history
+    user_input = resolve_references(state["messages"][-1].content, state.get("entities")) or state["messages"][-1].content
 
     # Check cache for recent response
     cached_response = check_cache(user_input)
@@ -424,17 +568,41 @@ def agent_node(state: AgentState, llm, tools, tool_map):
         logger.info(f"Response time (cache hit): {response_time:.2f} seconds")
         return {"messages": [AIMessage(content=cached_response)]}
 
-    prompt = prompt_template.format(
-        system_message=system_message,
-        tool_names=tool_names,
-        date=date.today().strftime('%d %b %Y'),
-        input=user_input,
-        history=history
-    )
+    # Formulaic requests map straight to a tool call without generating
+    tool_call = fast_path.parse(user_input)
+    if tool_call:
+        return run_tool_call(user_input, tool_call, tool_map, start_time, source="fast path")
 
-    response = llm.invoke(prompt).strip()
+    route = route_turn(state["messages"], state.get("rasa_confidence"), user_input)
+    decoding = tool_grammar.kwargs_for()
+    prompt = build_prompt(state["messages"], tools, state.get("summary", ""), user_input)
+    response = llm.invoke(prompt, route=route, **decoding).strip()
     logger.debug(f"Raw LLM response: {response}")
+    return process_llm_response(user_input, response, tool_map, start_time)
+
+def run_tool_call(user_input: str, tool_call: Dict, tool_map, start_time: float, source: str = "tool call"):
+    """Invoke one {"name", "parameters"} tool call and store its result."""
+    fix_tool_call_params(tool_call)
+    tool = tool_map.get(tool_call["name"])
+    if not tool:
+        logger.warning(f"Invalid tool name: {tool_call['name']}")
+        return {"messages": [AIMessage(content=f"Invalid tool name: {tool_call['name']}")]}
+    try:
+        logger.info(f"Invoking tool: {tool_call['name']} with parameters: {tool_call['parameters']}")
+        tool_result = tool.invoke(tool_call["parameters"])
+        logger.debug(f"Tool result: {tool_result}")
+        # Store query and response in database
+        store_query_response(user_input, tool_result, tool_call["name"])
+        response_time = time_module.time() - start_time
+        logger.info(f"Response time ({source}): {response_time:.2f} seconds")
+        entities = entities_from_calls([(tool_call["name"], tool_call["parameters"], tool_result)])
+        return {"messages": [AIMessage(content=tool_result)], "entities": entities}
+    except Exception as e:
+        logger.error(f"Tool execution error: {e}")
+        return {"messages": [AIMessage(content=f"Error executing tool {tool_call['name']}: {str(e)}")]}
 
+def process_llm_response(user_input: str, response: str, tool_map, start_time: float):
+    """Run the tool call(s) in a completed LLM response, or return it as plain text."""
     if not response:
         logger.warning("LLM returned empty response")
         return {"messages": [AIMessage(content="Sorry, I couldn't generate a response. Please try again.")]}
@@ -442,38 +610,16 @@ def agent_node(state: AgentState, llm, tools, tool_map):
     # Strip 'assistant: ' prefix if present
     response = response.replace("assistant: ", "").strip()
 
-    # Try parsing as JSON
-    json_match = re.match(r'\{.*\}', response, re.DOTALL)
+    # Try parsing as JSON: a single tool call, or a list of independent tool calls
+    json_match = re.match(r'\[.*\]|\{.*\}', response, re.DOTALL)
     if json_match:
         json_str = json_match.group(0)
         try:
             tool_call = json.loads(json_str)
-            if isinstance(tool_call, dict) and "name" in tool_call and "parameters" in tool_call:
-                # Fix incorrect parameter names for get_flights
-                if tool_call["name"] == "get_flights":
-                    params = tool_call["parameters"]
-                    if "from_city" in params:
-                        params["from_location"] = params.pop("from_city")
-                    if "to_city" in params:
-                        params["to_location"] = params.pop("to_city")
-
-                tool = tool_map.get(tool_call["name"])
-                if tool:
-                    try:
-                        logger.info(f"Invoking tool: {tool_call['name']} with parameters: {tool_call['parameters']}")
-                        tool_result = tool.invoke(tool_call["parameters"])
-                        logger.debug(f"Tool result: {tool_result}")
-                        # Store query and response in database
-                        store_query_response(user_input, tool_result, tool_call["name"])
-                        response_time = time_module.time() - start_time
-                        logger.info(f"Response time (tool call): {response_time:.2f} seconds")
-                        return {"messages": [AIMessage(content=tool_result)]}
-                    except Exception as e:
-                        logger.error(f"Tool execution error: {e}")
-                        return {"messages": [AIMessage(content=f"Error executing tool {tool_call['name']}: {str(e)}")]}
-                else:
-                    logger.warning(f"Invalid tool name: {tool_call['name']}")
-                    return {"messages": [AIMessage(content=f"Invalid tool name: {tool_call['name']}")]}
+            if isinstance(tool_call, list):
+                return run_parallel_tool_calls(user_input, tool_call, tool_map, start_time)
+            if is_tool_call(tool_call):
+                return run_tool_call(user_input, tool_call, tool_map, start_time)
             else:
                 logger.warning("Invalid tool call format")
                 return {"messages": [AIMessage(content="Invalid tool call format.")]}
@@ -488,15 +634,151 @@ def agent_node(state: AgentState, llm, tools, tool_map):
     logger.info(f"Response time (plain text): {response_time:.2f} seconds")
     return {"messages": [AIMessage(content=response)]}
 
+def compact_node(state: AgentState):
+    """Keep the session's messages within the history budget by folding older turns into the summary."""
+    older, _ = split_window(state["messages"])
+    if not older:
+        return {}
+    logger.debug(f"Summarizing {len(older)} older messages")
+    return {
+        "summary": fold_summary(state.get("summary", ""), older),
+        "messages": [RemoveMessage(id=msg.id) for msg in older],
+    }
+
 # Create StateGraph
 workflow = StateGraph(AgentState)
 workflow.add_node("agent", lambda state: agent_node(state, llm, tools, tool_map))
-workflow.add_edge("agent", END)
+workflow.add_node("compact", compact_node)
+workflow.add_edge("agent", "compact")
+workflow.add_edge("compact", END)
 workflow.set_entry_point("agent")
 
-# Compile the graph with MemorySaver
+# Compile the graph with the session checkpointer
 app_graph = workflow.compile(checkpointer=checkpoint)
 
+def build_messages(user_input: str, chat_history: List[Dict]) -> List[Any]:
+    messages = []
+    for entry in chat_history:
+        if entry.get('role') == 'user':
+            messages.append(HumanMessage(content=entry.get('content')))
+        elif entry.get('role') == 'assistant':
+            messages.append(AIMessage(content=entry.get('content')))
+    messages.append(HumanMessage(content=user_input))
+    return messages
+
+def sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Prefix the model sometimes emits before its answer; never streamed to the client
+ASSISTANT_PREFIX = "assistant: "
+
+def stream_agent_turn(state: Dict[str, Any], record: Callable[[Dict[str, Any]], None], session_id: Optional[str] = None):
+    """Start one agent turn for /llm/stream and return an iterator of SSE frames.
+
+    state is the session's graph state with the new user message appended; the
+    turn resolves references, checks the cache and the fast path, routes and
+    builds the prompt exactly like agent_node. record(update) receives the
+    node's state update once the answer is complete.
+
+    The completion is queued before this returns, so a full scheduler queue raises
+    SchedulerOverloaded to the route. Plain-text answers are sent token by token.
+    Output that starts with '{' or '[' is a tool call: it is buffered, never sent
+    raw, and only the tool result is streamed once the tools have run.
+    """
+    start_time = time_module.time()
+    messages = state["messages"]
+    user_input = resolve_references(messages[-1].content, state.get("entities")) or messages[-1].content
+
+    def done(update: Dict[str, Any]) -> str:
+        record(update)
+        answer = update["messages"][-1].content
+        return sse("done", {"response": answer, "session_id": session_id} if session_id else {"response": answer})
+
+    cached_response = check_cache(user_input)
+    if cached_response:
+        logger.info(f"Response time (cache hit): {time_module.time() - start_time:.2f} seconds")
+        return iter([sse("token", {"text": cached_response}), done({"messages": [AIMessage(content=cached_response)]})])
+
+    tool_call = fast_path.parse(user_input)
+    if tool_call:
+        def run_fast_path():
+            yield sse("status", {"state": "tool_call"})
+            update = run_tool_call(user_input, tool_call, tool_map, start_time, source="fast path")
+            yield sse("token", {"text": update["messages"][-1].content})
+            yield done(update)
+        return run_fast_path()
+
+    route = route_turn(messages, state.get("rasa_confidence"), user_input)
+    prompt = build_prompt(messages, tools, state.get("summary", ""), user_input)
+    chunks = llm.stream(prompt, route=route, **tool_grammar.kwargs_for())
+
+    def generate():
+        buffer, mode = "", None
+        try:
+            for chunk in chunks:
+                if not buffer:
+                    logger.info(f"Time to first token: {time_module.time() - start_time:.2f} seconds")
+                buffer += chunk
+                if mode == "text":
+                    yield sse("token", {"text": chunk})
+                    continue
+                if mode == "tool":
+                    continue
+                head = buffer.lstrip()
+                if head.startswith(ASSISTANT_PREFIX):
+                    head = head[len(ASSISTANT_PREFIX):].lstrip()
+                elif not head or ASSISTANT_PREFIX.startswith(head):
+                    # Not enough text yet to tell an answer from a tool call
+                    continue
+                if not head:
+                    continue
+                if head[0] in "{[":
+                    mode = "tool"
+                    yield sse("status", {"state": "tool_call"})
+                else:
+                    mode = "text"
+                    yield sse("token", {"text": head})
+
+            response = buffer.strip()
+            if mode == "text":
+                answer = response.replace(ASSISTANT_PREFIX, "").strip()
+                store_query_response(user_input, answer, "none")
+                update = {"messages": [AIMessage(content=answer)]}
+            else:
+                update = process_llm_response(user_input, response, tool_map, start_time)
+                yield sse("token", {"text": update["messages"][-1].content})
+            logger.info(f"Response time (stream, {mode or 'empty'}): {time_module.time() - start_time:.2f} seconds")
+            yield done(update)
+        except SchedulerOverloaded as e:
+            logger.warning(f"Shedding /llm/stream request: {e}")
+            yield sse("error", {"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error in llm_stream: {e}")
+            yield sse("error", {"error": str(e)})
+
+    return generate()
+
+def session_turn_messages(config: Dict, data: Dict) -> Tuple[Dict[str, Any], List[Any]]:
+    """The session's stored state and the messages this request adds to it.
+
+    The session holds the conversation, so only the new turn is added to it. A full
+    chat_history from older clients only seeds a session the server does not know yet.
+    """
+    stored = app_graph.get_state(config).values
+    messages = [HumanMessage(content=data.get('input'))]
+    if data.get('chat_history') and not stored.get("messages"):
+        messages = build_messages(data.get('input'), data['chat_history'])
+    return stored, messages
+
+def record_streamed_turn(config: Dict, new_messages: List[Any], update: Dict[str, Any], rasa_confidence: Optional[float]):
+    """Write a streamed turn into the session as if the agent node had produced it, then run the compact node."""
+    try:
+        app_graph.update_state(config, {**update, "messages": new_messages + update["messages"], "rasa_confidence": rasa_confidence},
+                               as_node="agent")
+        app_graph.invoke(None, config=config)
+    except Exception as e:
+        logger.error(f"Error saving streamed turn to session {config['configurable']['thread_id']}: {e}")
+
 @app.route('/llm', methods=['POST'])
 def llm_fallback():
     data = request.json
@@ -504,27 +786,96 @@ def llm_fallback():
         logger.error("Invalid request: 'input' field is required")
         return jsonify({"error": "Invalid request: 'input' field is required"}), 400
     
-    user_input = data.get('input')
-    chat_history = data.get('chat_history', [])
+    # Each conversation is its own LangGraph thread; a new one is started if the caller sends none
+    session_id = str(data.get('session_id') or uuid.uuid4())
+    config = {"configurable": {"thread_id": session_id}}
     try:
-        messages = []
-        for entry in chat_history:
-            if entry.get('role') == 'user':
-                messages.append(HumanMessage(content=entry.get('content')))
-            elif entry.get('role') == 'assistant':
-                messages.append(AIMessage(content=entry.get('content')))
-        messages.append(HumanMessage(content=user_input))
-
-        response = app_graph.invoke({"messages": messages}, config={"configurable": {"thread_id": "1"}})
+        _, messages = session_turn_messages(config, data)
+        response = app_graph.invoke({"messages": messages, "rasa_confidence": data.get('rasa_confidence')}, config=config)
 
         assistant_response = response['messages'][-1].content
         logger.info(f"Returning response: {assistant_response}")
-        return jsonify({"response": assistant_response})
+        return jsonify({"response": assistant_response, "session_id": session_id})
+    except SchedulerOverloaded as e:
+        logger.warning(f"Shedding /llm request: {e}")
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         logger.error(f"Error in llm_fallback: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/llm/stream', methods=['POST'])
+def llm_stream():
+    """Server-sent events: 'token' chunks of the answer, 'status' when a tool call starts, then 'done'.
+
+    Uses the same session state as /llm; 'done' carries the session_id.
+    """
+    data = request.json
+    if not data or 'input' not in data:
+        logger.error("Invalid request: 'input' field is required")
+        return jsonify({"error": "Invalid request: 'input' field is required"}), 400
+    session_id = str(data.get('session_id') or uuid.uuid4())
+    config = {"configurable": {"thread_id": session_id}}
+    rasa_confidence = data.get('rasa_confidence')
+    try:
+        stored, messages = session_turn_messages(config, data)
+        state = {
+            "messages": list(stored.get("messages", [])) + messages,
+            "summary": stored.get("summary", ""),
+            "entities": stored.get("entities") or {},
+            "rasa_confidence": rasa_confidence,
+        }
+
+        def record(update: Dict[str, Any]):
+            record_streamed_turn(config, messages, update, rasa_confidence)
+        events = stream_agent_turn(state, record, session_id)
+    except SchedulerOverloaded as e:
+        logger.warning(f"Shedding /llm/stream request: {e}")
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+    except Exception as e:
+        logger.error(f"Error in llm_stream: {e}")
+        return jsonify({"error": str(e)}), 500
+    return Response(events, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session_id})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    stats = {db_path: cache.stats() for db_path, cache in response_caches.items()}
+    stats["flight_offers"] = flight_offers.stats()
+    return jsonify(stats)
+
+@app.route('/llm/metrics', methods=['GET'])
+def llm_metrics():
+    stats = scheduler.stats()
+    for name, prefix_cache in llm.prefix_caches.items():
+        stats[name]["prefix_cache"] = prefix_cache.stats()
+    stats["routes"] = llm.router.stats()
+    stats["fast_path"] = fast_path.stats()
+    stats["grammar"] = tool_grammar.stats()
+    stats["sessions"] = checkpoint.stats()
+    if SPECULATIVE_DECODING:
+        stats["speculative"] = speculative_stats.stats()
+    return jsonify(stats)
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness: the process is up and serving HTTP, whether or not models are loaded."""
+    return jsonify({"status": "ok"})
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: start-up warm-ups are done and no model is failing to load."""
+    models_state = {name: {context.name: context.stats() for context in contexts} for name, contexts in models.items()}
+    if scheduler.is_ready():
+        return jsonify({"status": "ready", "models": models_state})
+    return jsonify({"status": "starting", "models": models_state}), 503
+
 if __name__ == '__main__':
-    # Clean up old database entries on startup
+    # Exit through sys.exit on SIGTERM so atexit handlers flush pending history writes
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # Clean up old database entries and expired sessions on startup
     cleanup_old_entries()
+    checkpoint.purge_expired()
+    # Load and warm the configured models in the background while Flask binds its port
+    for name in MODEL_WARMUP:
+        scheduler.warm_up(name)
     app.run(host='127.0.0.1', port=5000)
\ No newline at end of file
@@ -0,0 +1,300 @@
+import logging
+import math
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from time import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+from config import LLM_MAX_QUEUE_DEPTH, LLM_QUEUE_TIMEOUT, MODEL_IDLE_UNLOAD
+from model_loader import LazyModel
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a streamed completion
+_END_OF_STREAM = object()
+# How often an idle worker checks whether its model should be unloaded
+IDLE_CHECK_INTERVAL = 30
+# How long a warmed context waits for the model's other contexts to pick up their warm-up
+WARMUP_BARRIER_TIMEOUT = 60
+
+class SchedulerOverloaded(Exception):
+    """Raised when a request cannot be served in time; retry_after is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class _Job:
+    __slots__ = ("fn", "future", "enqueued_at", "deadline")
+
+    def __init__(self, fn: Callable[[Any], Any], deadline: float):
+        self.fn = fn
+        self.future: Future = Future()
+        self.enqueued_at = time()
+        self.deadline = deadline
+
+class _ModelPool:
+    """Bounded queue shared by one model's contexts, each owned by its own worker thread.
+
+    A context is only touched by its thread: it is loaded there by the first job
+    and unloaded there after idle_unload seconds without work, so loading and
+    unloading never race a generation. Jobs go to whichever context is free.
+    """
+
+    def __init__(self, name: str, contexts: List[LazyModel], max_queue_depth: int, idle_unload: float):
+        self.name = name
+        self.contexts = contexts
+        self.idle_unload = idle_unload
+        self.queue: "queue.Queue[_Job]" = queue.Queue(maxsize=max_queue_depth)
+        self.max_queue_depth = max_queue_depth
+        self.busy = 0
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.completed = 0
+        self.failed = 0
+        self.waits = deque(maxlen=200)
+        self.avg_service_time = 0.0
+        self.threads = [
+            threading.Thread(target=self._run, args=(context,), name=f"llm-{context.name}", daemon=True)
+            for context in contexts
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def estimated_wait(self) -> float:
+        return (self.queue.qsize() + self.busy) * self.avg_service_time / len(self.contexts)
+
+    def overloaded(self, wait: float) -> SchedulerOverloaded:
+        return SchedulerOverloaded(f"{self.name} request waited {wait:.1f}s in queue", max(1, math.ceil(self.estimated_wait())))
+
+    def expire(self, job: "_Job") -> bool:
+        """Cancel a job still waiting in the queue; False once a context has started it."""
+        if not job.future.cancel():
+            return False
+        with self.lock:
+            self.expired += 1
+        logger.warning(f"{self.name} request expired after {time() - job.enqueued_at:.1f}s in queue")
+        return True
+
+    def _run(self, context: LazyModel):
+        while True:
+            try:
+                job = self.queue.get(timeout=IDLE_CHECK_INTERVAL)
+            except queue.Empty:
+                context.unload_if_idle(self.idle_unload)
+                continue
+            # Cancelled by a caller that stopped waiting at its deadline
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            wait = time() - job.enqueued_at
+            self.waits.append(wait)
+            if time() > job.deadline:
+                # The caller has been told to retry; do not spend the model on it
+                with self.lock:
+                    self.expired += 1
+                job.future.set_exception(self.overloaded(wait))
+                continue
+            with self.lock:
+                self.busy += 1
+            start = time()
+            ok = False
+            try:
+                model = context.get()
+                # Service time excludes loading so Retry-After estimates reflect generation
+                start = time()
+                job.future.set_result(job.fn(model))
+                ok = True
+            except BaseException as e:
+                job.future.set_exception(e)
+            finally:
+                service_time = time() - start
+                with self.lock:
+                    self.busy -= 1
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    # Exponential moving average, seeded by the first request
+                    self.avg_service_time = service_time if not self.avg_service_time else 0.8 * self.avg_service_time + 0.2 * service_time
+                logger.info(f"{context.name} inference: waited {wait:.2f}s, ran {service_time:.2f}s, {self.queue.qsize()} queued")
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.waits)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "busy": self.busy,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_seconds": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "p95_wait_seconds": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+            "avg_service_seconds": round(self.avg_service_time, 3),
+            "contexts": {context.name: context.stats() for context in self.contexts},
+        }
+
+def _all_done(futures: List[Future]) -> Future:
+    """A Future that completes once all of futures have, with the first error if any failed."""
+    combined: Future = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result([f.result() for f in futures])
+
+    for future in futures:
+        future.add_done_callback(done)
+    return combined
+
+class InferenceScheduler:
+    """Dispatches work for each LlamaCpp model to a pool of contexts with one worker thread each.
+
+    llama.cpp contexts must not be used from several threads at once, so request
+    threads submit work here instead of calling a model directly. Each model has
+    a queue of at most max_queue_depth requests served by whichever of its
+    contexts is free; a full queue, or a request that waited longer than
+    queue_timeout seconds, raises SchedulerOverloaded with a Retry-After estimate
+    so the endpoint can shed load quickly. Models are LazyModel handles (or lists
+    of them, see model_loader.context_pool), loaded by their worker on first use.
+    """
+
+    def __init__(self, models: Dict[str, Union[LazyModel, List[LazyModel]]], max_queue_depth: int = LLM_MAX_QUEUE_DEPTH,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT, idle_unload: float = MODEL_IDLE_UNLOAD):
+        self.queue_timeout = queue_timeout
+        self.pools = {
+            name: _ModelPool(name, contexts if isinstance(contexts, list) else [contexts], max_queue_depth, idle_unload)
+            for name, contexts in models.items()
+        }
+        self._warmups: Dict[str, Future] = {}
+
+    def submit(self, model_name: str, fn: Callable[[Any], Any], queue_timeout: Optional[float] = None) -> Future:
+        """Queue fn(model) for the next free context of the model and return its Future."""
+        return self._submit(model_name, fn, queue_timeout).future
+
+    def _submit(self, model_name: str, fn: Callable[[Any], Any], queue_timeout: Optional[float] = None) -> _Job:
+        pool = self.pools[model_name]
+        job = _Job(fn, time() + (self.queue_timeout if queue_timeout is None else queue_timeout))
+        try:
+            with pool.lock:
+                pool.submitted += 1
+                pool.queue.put_nowait(job)
+        except queue.Full:
+            with pool.lock:
+                pool.rejected += 1
+            retry_after = max(1, math.ceil(pool.estimated_wait()))
+            logger.warning(f"{model_name} queue full ({pool.max_queue_depth}), rejecting request; retry after {retry_after}s")
+            raise SchedulerOverloaded(f"{model_name} inference queue is full", retry_after)
+        return job
+
+    def run(self, model_name: str, fn: Callable[[Any], Any], queue_timeout: Optional[float] = None) -> Any:
+        """Blocking submit: wait for fn(model) and return its result.
+
+        Raises SchedulerOverloaded once the queue timeout passes without a context
+        starting the job; a job that started runs to completion.
+        """
+        pool = self.pools[model_name]
+        job = self._submit(model_name, fn, queue_timeout)
+        try:
+            return job.future.result(timeout=max(0.0, job.deadline - time()))
+        except FutureTimeoutError:
+            if pool.expire(job):
+                raise pool.overloaded(time() - job.enqueued_at)
+        return job.future.result()
+
+    def invoke(self, model_name: str, prompt: str, **kwargs) -> str:
+        return self.run(model_name, lambda model: model.invoke(prompt, **kwargs))
+
+    def stream(self, model_name: str, prompt: str, prepare: Optional[Callable[[Any], None]] = None, **kwargs) -> Iterator[str]:
+        """Stream model.stream(prompt) chunks from the worker thread.
+
+        The request is queued immediately, so a full queue raises SchedulerOverloaded
+        here rather than on first iteration. prepare(model) runs on the worker just
+        before generation and may return the keyword arguments for model.stream,
+        replacing kwargs (e.g. ones that depend on the context). Closing the iterator early (e.g. the client disconnected)
+        stops generation after the current token.
+        """
+        chunks: "queue.Queue" = queue.Queue()
+        cancelled = threading.Event()
+
+        def produce(model):
+            try:
+                stream_kwargs = prepare(model) if prepare is not None else None
+                for chunk in model.stream(prompt, **(kwargs if stream_kwargs is None else stream_kwargs)):
+                    if cancelled.is_set():
+                        logger.info(f"{model_name} stream cancelled by consumer")
+                        break
+                    chunks.put(chunk)
+            finally:
+                chunks.put(_END_OF_STREAM)
+
+        pool = self.pools[model_name]
+        job = self._submit(model_name, produce)
+        future = job.future
+
+        def consume() -> Iterator[str]:
+            try:
+                while True:
+                    try:
+                        chunk = chunks.get(timeout=0.1)
+                    except queue.Empty:
+                        # Expired in the queue: produce() never ran, so surface the error
+                        if future.done() and chunks.empty():
+                            future.result()
+                            return
+                        # Still queued past the deadline: stop waiting for the first chunk
+                        if time() > job.deadline and pool.expire(job):
+                            raise pool.overloaded(time() - job.enqueued_at)
+                        continue
+                    if chunk is _END_OF_STREAM:
+                        future.result()
+                        return
+                    yield chunk
+            finally:
+                cancelled.set()
+
+        return consume()
+
+    def warm_up(self, model_name: str, prompt: str = "Hello") -> Future:
+        """Load every context of a model in the background with a one-token generation each.
+
+        Each warm-up job holds its context at a barrier until all of them have
+        started, so no context picks up two of them while another stays cold.
+        """
+        pool = self.pools[model_name]
+        barrier = threading.Barrier(len(pool.contexts))
+
+        def warm(model):
+            result = model.invoke(prompt, max_tokens=1)
+            try:
+                barrier.wait(timeout=WARMUP_BARRIER_TIMEOUT)
+            except threading.BrokenBarrierError:
+                # Another context is serving traffic; it loads on its first request instead
+                pass
+            return result
+
+        futures = [self.submit(model_name, warm, queue_timeout=float("inf")) for _ in pool.contexts]
+        future = _all_done(futures)
+        self._warmups[model_name] = future
+        return future
+
+    def is_ready(self) -> bool:
+        """True once every requested warm-up finished and no model is stuck failing to load."""
+        if not all(future.done() for future in self._warmups.values()):
+            return False
+        return all(context.state != "failed" for pool in self.pools.values() for context in pool.contexts)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: pool.stats() for name, pool in self.pools.items()}
@@ -1,53 +1,58 @@
 import os
-from langchain_community.llms import LlamaCpp
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.messages import BaseMessage
 from langchain_core.prompts import PromptTemplate
 import logging
-from config import MODEL_1B_PATH, MODEL_3B_PATH
+from time import time
+from config import MODEL_1B_PATH, MODEL_3B_PATH, MODEL_IDLE_UNLOAD, SPECULATIVE_DECODING
+from model_loader import LazyModel, load_llama
+from prefix_cache import PrefixCache
+from speculative import timed_generation
+from tool_grammar import ToolGrammar
+from model_router import ModelRouter, user_turn
 from typing import List, Optional, Dict, Any, Iterator, AsyncIterator
 from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
 
+# The ReAct prompt in agent.py is static (system message, tools, format) up to the first question
+PROMPT_INPUT_MARKER = "Question: "
+
 class DynamicLlamaCpp(BaseLanguageModel):
-    llm_1b: Optional[LlamaCpp] = None
-    llm_3b: Optional[LlamaCpp] = None
+    models: Dict[str, Any] = {}
+    prefix_caches: Dict[str, Any] = {}
+    router: Optional[Any] = None
 
     def __init__(self):
         super().__init__()
         if not os.path.exists(MODEL_1B_PATH) or not os.path.exists(MODEL_3B_PATH):
             raise FileNotFoundError(f"Model files not found: {MODEL_1B_PATH}, {MODEL_3B_PATH}")
-        
-        try:
-            self.llm_1b = LlamaCpp(
-                model_path=MODEL_1B_PATH,
-                n_ctx=1024,
-                n_gpu_layers=50,
-                temperature=0.1,
-                max_tokens=1000,
-                verbose=True,
-                stop=["\n", "Please", "<|eot_id|>", "Result:", "Note:", "This is", ";"]
-            )
-            self.llm_3b = LlamaCpp(
-                model_path=MODEL_3B_PATH,
-                n_ctx=1024,
-                n_gpu_layers=50,
-                temperature=0.1,
-                max_tokens=1000,
-                verbose=True,
-                stop=["\n", "Please", "<|eot_id|>", "Result:", "Note:", "This is", ";"]
-            )
-        except Exception as e:
-            logger.error(f"Error loading Llama models: {e}")
-            raise
+        # Loaded on first use and dropped again after MODEL_IDLE_UNLOAD seconds unused;
+        # with speculative decoding the 3B model drafts with its own 1B context
+        draft_path = MODEL_1B_PATH if SPECULATIVE_DECODING else None
+        self.models = {
+            "1b": LazyModel("1b", lambda: load_llama(MODEL_1B_PATH)),
+            "3b": LazyModel("3b", lambda: load_llama(MODEL_3B_PATH, draft_path)),
+        }
+        self.prefix_caches = {"1b": PrefixCache(PROMPT_INPUT_MARKER), "3b": PrefixCache(PROMPT_INPUT_MARKER)}
+        self.router = ModelRouter()
 
     def _select_llm(self, input_text: str):
-        input_tokens = len(self.llm_1b.client.tokenize(input_text.encode('utf-8')))
-        selected_llm = self.llm_1b if input_tokens < 100 else self.llm_3b
-        logger.info(f"Selected model: {'1B' if input_tokens < 100 else '3B'} for {input_tokens} tokens")
+        # Score the question only; the ReAct prompt around it is always long
+        route = self.router.route(user_turn(input_text, PROMPT_INPUT_MARKER))
         logger.debug(f"Input prompt: {input_text}")
-        return selected_llm
+        # The agent runs one call at a time, so an idle model can be dropped here safely
+        for name, model in self.models.items():
+            if name != route.model:
+                model.unload_if_idle(MODEL_IDLE_UNLOAD)
+        return self.models[route.model].get()
+
+    def _route_name(self, selected_llm) -> str:
+        return next(name for name, model in self.models.items() if model.model is selected_llm)
+
+    def _restore_prefix(self, selected_llm, prompt_text: str):
+        """Reuse the cached KV state of the static prompt prefix for this model."""
+        self.prefix_caches[self._route_name(selected_llm)].prepare(selected_llm.client, prompt_text)
 
     def invoke(self, input: Any, config: Optional[Dict] = None, **kwargs) -> Any:
         if isinstance(input, list):
@@ -55,7 +60,17 @@ class DynamicLlamaCpp(BaseLanguageModel):
         else:
             prompt_text = str(input)
         selected_llm = self._select_llm(prompt_text)
-        return selected_llm.invoke(prompt_text, config=config, **kwargs)
+        self._restore_prefix(selected_llm, prompt_text)
+        route = self._route_name(selected_llm)
+        kwargs = ToolGrammar.resolve(selected_llm.client, kwargs)
+        start = time()
+        try:
+            result = timed_generation(selected_llm, lambda: selected_llm.invoke(prompt_text, config=config, **kwargs))
+        except Exception:
+            self.router.record(route, time() - start, ok=False)
+            raise
+        self.router.record(route, time() - start)
+        return result
 
     def bind(self, **kwargs):
         # Use LangChain's built-in bind to wrap the LLM with additional kwargs
@@ -63,6 +78,8 @@ class DynamicLlamaCpp(BaseLanguageModel):
 
     def generate(self, prompts: List[str], **kwargs) -> List[str]:
         selected_llm = self._select_llm(prompts[0] if prompts else "")
+        if len(prompts) == 1:
+            self._restore_prefix(selected_llm, prompts[0])
         return selected_llm.generate(prompts, **kwargs)
 
     async def agenerate(self, prompts: List[str], **kwargs) -> List[str]:
@@ -87,11 +104,13 @@ class DynamicLlamaCpp(BaseLanguageModel):
 
     def stream(self, input: str, **kwargs) -> Iterator[str]:
         selected_llm = self._select_llm(input)
-        return selected_llm.stream(input, **kwargs)
+        self._restore_prefix(selected_llm, input)
+        return selected_llm.stream(input, **ToolGrammar.resolve(selected_llm.client, kwargs))
 
     async def astream(self, input: str, **kwargs) -> AsyncIterator[str]:
         selected_llm = self._select_llm(input)
-        return await selected_llm.astream(input, **kwargs)
+        async for chunk in selected_llm.astream(input, **kwargs):
+            yield chunk
 
     def generate_prompt(self, prompts: List[PromptTemplate], stop: Optional[List[str]] = None, **kwargs) -> Any:
         selected_llm = self._select_llm(prompts[0].template if prompts else "")
@@ -0,0 +1,155 @@
+import gc
+import json
+import logging
+import os
+import threading
+from time import time
+from typing import Any, Callable, Dict, List, Optional
+from langchain_community.llms import LlamaCpp
+from config import MODEL_USE_MMAP, LLM_CONTEXTS_PER_MODEL, LLM_THREADS, INFERENCE_PROFILE_PATH
+
+logger = logging.getLogger(__name__)
+
+def load_profile(path: str = INFERENCE_PROFILE_PATH) -> Dict[str, Dict[str, Any]]:
+    """Tuned settings per configured model path from tune_inference.py, or {} if this host has none."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+        logger.info(f"Loaded inference profile {path} (tuned {profile.get('created')})")
+        return profile.get("models", {})
+    except Exception as e:
+        logger.error(f"Error loading inference profile {path}: {e}")
+        return {}
+
+inference_profile = load_profile()
+
+def tuned_settings(model_path: str) -> Dict[str, Any]:
+    """LlamaCpp settings from the host profile for model_path; the tuned quantization replaces model_path."""
+    tuned = inference_profile.get(model_path)
+    if not tuned:
+        return {}
+    settings = {key: tuned[key] for key in ("model_path", "n_threads", "n_batch", "n_gpu_layers") if key in tuned}
+    if not os.path.exists(settings.get("model_path", model_path)):
+        logger.warning(f"Tuned model {settings['model_path']} not found, using {model_path}")
+        settings.pop("model_path")
+    return settings
+
+def load_llama(model_path: str, draft_model_path: Optional[str] = None, **overrides) -> LlamaCpp:
+    """Build a LlamaCpp with the settings both LLM pipelines use.
+
+    With use_mmap the GGUF weights are paged in on demand instead of being read
+    up front, so loading takes a fraction of a second and a reload after an idle
+    unload mostly hits the page cache. With draft_model_path the model decodes
+    speculatively with that smaller model as its draft (see speculative.py).
+    Settings tuned for this host by tune_inference.py replace the defaults; an
+    n_threads override is capped at the tuned count, as more threads only contend.
+    """
+    params = dict(
+        model_path=model_path,
+        n_ctx=1024,
+        n_gpu_layers=50,
+        temperature=0.1,
+        max_tokens=1000,
+        verbose=True,
+        use_mmap=MODEL_USE_MMAP,
+        stop=["\n", "Please", "<|eot_id|>", "Result:", "Note:", "This is", ";"]
+    )
+    tuned = tuned_settings(model_path)
+    params.update(tuned)
+    if overrides.get("n_threads") and tuned.get("n_threads"):
+        overrides["n_threads"] = min(overrides["n_threads"], tuned["n_threads"])
+    params.update(overrides)
+    if draft_model_path:
+        draft_model_path = tuned_settings(draft_model_path).get("model_path", draft_model_path)
+        from speculative import draft_params
+        params.update(draft_params(draft_model_path, n_ctx=params["n_ctx"], n_gpu_layers=params["n_gpu_layers"],
+                                   n_threads=params.get("n_threads")))
+    return LlamaCpp(**params)
+
+class LazyModel:
+    """A model that is loaded on first use and can be dropped again when idle.
+
+    get() loads under a lock and marks the model as used. Callers must make sure
+    unload() never runs while another thread is generating, e.g. by only
+    calling it from the thread that owns the model.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any]):
+        self.name = name
+        self.loader = loader
+        self.model: Optional[Any] = None
+        self.state = "unloaded"
+        self.error: Optional[str] = None
+        self.last_used = 0.0
+        self.load_seconds = 0.0
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        with self._lock:
+            if self.model is None:
+                self.state = "loading"
+                start = time()
+                try:
+                    self.model = self.loader()
+                except Exception as e:
+                    self.state, self.error = "failed", str(e)
+                    logger.error(f"Error loading {self.name} model: {e}")
+                    raise
+                self.load_seconds = time() - start
+                self.loads += 1
+                self.state, self.error = "ready", None
+                logger.info(f"Loaded {self.name} model in {self.load_seconds:.2f} seconds")
+            self.last_used = time()
+            return self.model
+
+    def idle_seconds(self) -> float:
+        return time() - self.last_used if self.model is not None else 0.0
+
+    def unload(self):
+        with self._lock:
+            if self.model is None:
+                return
+            self.model = None
+            self.state = "unloaded"
+        # llama.cpp frees the context and weights when the Llama object is collected
+        gc.collect()
+        logger.info(f"Unloaded {self.name} model")
+
+    def unload_if_idle(self, idle_timeout: float) -> bool:
+        if idle_timeout > 0 and self.model is not None and self.idle_seconds() > idle_timeout:
+            logger.info(f"{self.name} model idle for {self.idle_seconds():.0f}s")
+            self.unload()
+            return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "loads": self.loads,
+            "load_seconds": round(self.load_seconds, 3),
+            "idle_seconds": round(self.idle_seconds(), 1),
+        }
+
+def context_pool(name: str, model_path: str, size: int = LLM_CONTEXTS_PER_MODEL, n_threads: Optional[int] = None,
+                 draft_model_path: Optional[str] = None) -> List[LazyModel]:
+    """size lazily loaded contexts over one GGUF file, named e.g. "1b#0", "1b#1".
+
+    Each context is its own Llama object, but with use_mmap the weights are
+    mapped from the same file and shared through the page cache, so only the
+    KV cache and scratch buffers are allocated per context. n_threads defaults
+    to this model's share of LLM_THREADS (see context_threads()). Each context
+    gets its own draft context when draft_model_path is set.
+    """
+    threads = n_threads or context_threads(size)
+    return [
+        LazyModel(f"{name}#{i}", lambda: load_llama(model_path, draft_model_path, n_threads=threads))
+        for i in range(size)
+    ]
+
+def context_threads(contexts_per_model: int, models: int = 2, total: int = LLM_THREADS) -> int:
+    """Threads per context so that every context of every model busy at once uses total cores."""
+    return max(1, total // max(1, contexts_per_model * models))
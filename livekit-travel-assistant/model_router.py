@@ -0,0 +1,124 @@
+import logging
+import re
+import threading
+from collections import deque, namedtuple
+from typing import Any, Dict, List, Optional, Sequence
+from config import ROUTER_WEIGHTS, ROUTER_THRESHOLD, ROUTER_HISTORY_TURNS, ROUTER_FORCE_MODEL
+
+logger = logging.getLogger(__name__)
+
+RouteDecision = namedtuple("RouteDecision", ["model", "score", "signals"])
+
+# Phrases that map onto one of the tools; a turn with exactly one is a simple dispatch
+TOOL_PATTERNS = {
+    "get_weather": re.compile(r"\b(weather|temperature|forecast|rain|sunny|hot|cold)\b", re.I),
+    "get_flights": re.compile(r"\b(flights?|fly|plane tickets?)\b", re.I),
+    "get_attractions": re.compile(r"\b(attractions?|sights?|things to do|places to visit|landmarks?)\b", re.I),
+    # Currency codes only count in capitals, so "how to get to Paris" is not a conversion
+    "get_currency_conversion": re.compile(r"\b(convert|exchange|currency)\b|(?-i:\b[A-Z]{3} (?:to|into|in) [A-Z]{3}\b)", re.I),
+    "update_currency_rates": re.compile(r"\bupdate\b.*\brates?\b", re.I),
+    "get_time": re.compile(r"\b(time in|what time|timezone|time zone)\b", re.I),
+    "get_joke": re.compile(r"\bjoke\b", re.I),
+}
+# Turns that ask for planning, comparison or explanation rather than a lookup
+OPEN_ENDED = re.compile(r"\b(plan|itinerary|trip|compare|recommend|suggest|why|how should|explain|best|versus|vs)\b", re.I)
+# Words whose meaning depends on earlier turns
+CONTEXT_REFERENCES = re.compile(r"\b(there|it|that|those|same|again|instead|also)\b", re.I)
+
+class ModelRouter:
+    """Chooses the 1B or 3B model for a turn from the user input, not the whole prompt.
+
+    Each signal adds its weight (config.ROUTER_WEIGHTS) to a score; turns scoring
+    at or above ROUTER_THRESHOLD go to the large model. A single recognizable tool
+    request lowers the score so plain dispatch turns stay on the small model;
+    long, open-ended or context-dependent turns, several tools, a long recent
+    history and low Rasa intent confidence raise it. Per-route counts and
+    latencies are kept for /llm/metrics.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, threshold: float = ROUTER_THRESHOLD,
+                 history_turns: int = ROUTER_HISTORY_TURNS, small: str = "1b", large: str = "3b",
+                 force_model: Optional[str] = ROUTER_FORCE_MODEL):
+        self.weights = dict(ROUTER_WEIGHTS if weights is None else weights)
+        self.threshold = threshold
+        self.history_turns = history_turns
+        self.small = small
+        self.large = large
+        self.force_model = force_model or None
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def expected_tools(text: str) -> List[str]:
+        """Tools the turn's wording points at.
+
+        >>> ModelRouter.expected_tools("100 USD to EUR and the weather in Paris")
+        ['get_weather', 'get_currency_conversion']
+        >>> ModelRouter.expected_tools("how to get to Paris")
+        []
+        """
+        return [name for name, pattern in TOOL_PATTERNS.items() if pattern.search(text)]
+
+    def score(self, user_input: str, history: Sequence[str] = (), rasa_confidence: Optional[float] = None) -> Dict[str, float]:
+        """Return the weighted signals for one turn; their sum is the routing score."""
+        weights = self.weights
+        tools = self.expected_tools(user_input)
+        recent = list(history)[-self.history_turns:] if self.history_turns else []
+        signals = {}
+        if len(tools) == 1:
+            signals["single_tool"] = weights["single_tool"]
+        elif len(tools) > 1:
+            signals["multi_tool"] = weights["multi_tool"]
+        if OPEN_ENDED.search(user_input):
+            signals["open_ended"] = weights["open_ended"]
+        words = len(user_input.split())
+        if words > 12:
+            signals["long_input"] = weights["long_input"] * min(words / 12 - 1, 2)
+        if recent and CONTEXT_REFERENCES.search(user_input):
+            signals["context_reference"] = weights["context_reference"]
+        if recent:
+            signals["history"] = weights["history"] * len(recent) / max(self.history_turns, 1)
+        if rasa_confidence is not None:
+            # Rasa already narrowed the intent: high confidence is easy, low confidence is ambiguous
+            signals["rasa_confidence"] = weights["rasa_confidence"] * (0.5 - rasa_confidence)
+        return signals
+
+    def route(self, user_input: str, history: Sequence[str] = (), rasa_confidence: Optional[float] = None) -> RouteDecision:
+        if self.force_model:
+            return RouteDecision(self.force_model, 0.0, {"forced": 1.0})
+        signals = self.score(user_input, history, rasa_confidence)
+        total = sum(signals.values())
+        model = self.large if total >= self.threshold else self.small
+        logger.info(f"Routed to {model.upper()} (score {total:.2f}, signals {signals})")
+        return RouteDecision(model, total, signals)
+
+    def record(self, model: str, seconds: float, ok: bool = True):
+        """Record one completed generation on a route."""
+        with self._lock:
+            route = self._routes.setdefault(model, {"count": 0, "errors": 0, "latencies": deque(maxlen=200)})
+            route["count"] += 1
+            if not ok:
+                route["errors"] += 1
+            route["latencies"].append(seconds)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            stats = {}
+            for model, route in self._routes.items():
+                latencies = sorted(route["latencies"])
+                stats[model] = {
+                    "count": route["count"],
+                    "errors": route["errors"],
+                    "avg_latency_seconds": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+                    "p95_latency_seconds": round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else 0.0,
+                }
+            return stats
+
+def user_turn(prompt: str, marker: str) -> str:
+    """The user input line of a formatted prompt: the text after marker up to the end of that line."""
+    start = prompt.find(marker)
+    if start < 0:
+        return prompt
+    start += len(marker)
+    end = prompt.find("\n", start)
+    return prompt[start:] if end < 0 else prompt[start:end]
@@ -0,0 +1,95 @@
+import logging
+import threading
+import weakref
+from time import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class _Snapshot:
+    __slots__ = ("prefix", "tokens", "state")
+
+    def __init__(self, prefix: str, tokens: List[int], state):
+        self.prefix = prefix
+        self.tokens = tokens
+        self.state = state
+
+class PrefixCache:
+    """Keeps the KV state of a prompt's static prefix for each llama.cpp context of a model.
+
+    The static prefix is everything before marker (e.g. "User input: "): system
+    message, tool list and date. Once the same prefix has been seen twice it is
+    evaluated on its own and snapshotted with save_state(), separately for every
+    context (client) of the model. Before each later generation the snapshot is
+    restored unless the context already holds those tokens, so llama.cpp's own
+    longest-prefix matching only has to evaluate the user input and history.
+    Must be called on the thread that owns the context; snapshots are dropped
+    together with their context when a model is unloaded.
+    """
+
+    def __init__(self, marker: str):
+        self.marker = marker
+        self._snapshots: "weakref.WeakKeyDictionary[Any, _Snapshot]" = weakref.WeakKeyDictionary()
+        self._candidate: Optional[str] = None
+        self._lock = threading.Lock()
+        self.resident = 0
+        self.restores = 0
+        self.warms = 0
+        self.misses = 0
+
+    def _warm(self, client, prefix: str) -> _Snapshot:
+        start = time()
+        tokens = client.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)
+        client.reset()
+        client.eval(tokens)
+        snapshot = _Snapshot(prefix, tokens, client.save_state())
+        with self._lock:
+            self._snapshots[client] = snapshot
+            self.warms += 1
+        logger.info(f"Cached KV state for {len(tokens)} prefix tokens in {time() - start:.2f} seconds")
+        return snapshot
+
+    def prepare(self, client, prompt: str):
+        """Make sure the context starts with the cached prefix of prompt before it is generated."""
+        end = prompt.find(self.marker)
+        if end <= 0:
+            return
+        prefix = prompt[:end]
+        try:
+            with self._lock:
+                snapshot = self._snapshots.get(client)
+                if snapshot is None or snapshot.prefix != prefix:
+                    # Only snapshot a prefix that repeats; a one-off prompt would just pay for save_state
+                    if prefix != self._candidate:
+                        self._candidate = prefix
+                        self.misses += 1
+                        return
+                    snapshot = None
+            if snapshot is None:
+                snapshot = self._warm(client, prefix)
+            n = len(snapshot.tokens)
+            if client.n_tokens >= n and list(client.input_ids[:n]) == snapshot.tokens:
+                with self._lock:
+                    self.resident += 1
+                return
+            client.load_state(snapshot.state)
+            with self._lock:
+                self.restores += 1
+            logger.debug(f"Restored {n} cached prefix tokens")
+        except Exception as e:
+            # Generation still works without the cache, it just evaluates the whole prompt
+            logger.error(f"Prefix cache error: {e}")
+            with self._lock:
+                self._snapshots.pop(client, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshots = list(self._snapshots.values())
+            return {
+                "prefix_tokens": len(snapshots[0].tokens) if snapshots else 0,
+                "contexts": len(snapshots),
+                "resident": self.resident,
+                "restores": self.restores,
+                "warms": self.warms,
+                "misses": self.misses,
+            }
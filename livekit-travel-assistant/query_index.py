@@ -0,0 +1,170 @@
+import sqlite3
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Tuple
+from fuzzywuzzy import fuzz
+
+logger = logging.getLogger(__name__)
+
+class FuzzyQueryIndex:
+    """In-memory trigram index over cached queries for fuzzy cache lookups.
+
+    Candidates are narrowed with a length filter and a q-gram count filter that
+    never rejects a query whose fuzz.ratio could reach the threshold, then
+    verified with fuzz.ratio, so hits are the same as a full scan.
+    """
+
+    def __init__(self, q: int = 3):
+        self.q = q
+        self._lock = threading.RLock()
+        # query -> {"normalized", "grams", "response", "tool_name", "timestamp"}
+        self._entries: Dict[str, Dict] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._by_length: Dict[int, set] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Normalize a query the same way the cache scan compares them."""
+        return query.lower()
+
+    def _grams(self, text: str) -> Counter:
+        pad = "\x00" * (self.q - 1)
+        padded = f"{pad}{text}{pad}"
+        return Counter(padded[i:i + self.q] for i in range(len(padded) - self.q + 1))
+
+    def _insert(self, query: str, response: str, tool_name: str, timestamp: int):
+        normalized = self.normalize(query)
+        grams = self._grams(normalized)
+        self._entries[query] = {
+            "normalized": normalized,
+            "grams": grams,
+            "response": response,
+            "tool_name": tool_name,
+            "timestamp": timestamp,
+        }
+        for gram, count in grams.items():
+            self._postings[gram][query] = count
+        self._by_length[len(normalized)].add(query)
+
+    def remove(self, query: str):
+        """Drop a cached query from the index."""
+        with self._lock:
+            entry = self._entries.pop(query, None)
+            if not entry:
+                return
+            for gram in entry["grams"]:
+                posting = self._postings.get(gram)
+                if posting is not None:
+                    posting.pop(query, None)
+                    if not posting:
+                        del self._postings[gram]
+            bucket = self._by_length.get(len(entry["normalized"]))
+            if bucket is not None:
+                bucket.discard(query)
+                if not bucket:
+                    del self._by_length[len(entry["normalized"])]
+
+    def add(self, query: str, response: str, tool_name: str, timestamp: int):
+        """Mirror store_query_response: refresh the answer and timestamp of a known query, else insert it."""
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry:
+                entry["response"] = response
+                entry["tool_name"] = tool_name
+                entry["timestamp"] = timestamp
+                return
+            self._insert(query, response, tool_name, timestamp)
+
+    def prune(self, min_timestamp: int) -> int:
+        """Remove entries older than min_timestamp; returns the number removed."""
+        with self._lock:
+            stale = [q for q, e in self._entries.items() if e["timestamp"] < min_timestamp]
+            for query in stale:
+                self.remove(query)
+            return len(stale)
+
+    def load(self, db_path: str) -> int:
+        """Rebuild the index from the query_history table."""
+        with sqlite3.connect(db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT query, response, tool_name, timestamp FROM query_history
+                WHERE query IS NOT NULL AND response IS NOT NULL
+                ORDER BY timestamp ASC, id ASC
+            """)
+            rows = cursor.fetchall()
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._by_length.clear()
+            for query, response, tool_name, timestamp in rows:
+                # Later rows win, matching the newest-first order of the scan
+                if query in self._entries:
+                    self.remove(query)
+                self._insert(query, response, tool_name, int(timestamp or 0))
+        logger.info(f"Loaded {len(rows)} rows into fuzzy query index")
+        return len(rows)
+
+    def search(self, query: str, similarity_threshold: int = 90, min_timestamp: int = 0,
+               is_fresh=None) -> Optional[Tuple[str, Dict]]:
+        """Return (cached_query, entry) for the newest match at or above the threshold.
+
+        Only entries with timestamp > min_timestamp are considered; is_fresh can
+        further filter entries, e.g. by per-tool TTL.
+        """
+        normalized = self.normalize(query)
+        la = len(normalized)
+        if la == 0:
+            return None
+        # fuzz.ratio rounds 100 * r to an integer, so anything with r just
+        # under the threshold can still qualify.
+        min_ratio = max((similarity_threshold - 0.5) / 100 - 1e-9, 0.0)
+        if min_ratio <= 0:
+            lengths = None
+        else:
+            lo = int(la * min_ratio / (2 - min_ratio))
+            hi = int(la * (2 - min_ratio) / min_ratio) + 1
+            lengths = range(max(lo, 1), hi + 1)
+
+        with self._lock:
+            query_grams = self._grams(normalized)
+            overlap: Dict[str, int] = defaultdict(int)
+            for gram, count in query_grams.items():
+                for cached_query, cached_count in self._postings.get(gram, {}).items():
+                    overlap[cached_query] += min(count, cached_count)
+
+            # Lengths for which the count filter cannot rule anything out
+            # have to be checked in full.
+            candidates = set(overlap)
+            length_range = lengths if lengths is not None else list(self._by_length)
+            for lb in length_range:
+                if lb in self._by_length and self._required_overlap(la, lb, min_ratio) <= 0:
+                    candidates.update(self._by_length[lb])
+
+            best = None
+            for cached_query in candidates:
+                entry = self._entries[cached_query]
+                lb = len(entry["normalized"])
+                if lengths is not None and lb not in lengths:
+                    continue
+                if overlap.get(cached_query, 0) < self._required_overlap(la, lb, min_ratio):
+                    continue
+                if entry["timestamp"] <= min_timestamp:
+                    continue
+                if best is not None and entry["timestamp"] <= best[1]["timestamp"]:
+                    continue
+                if is_fresh is not None and not is_fresh(entry):
+                    continue
+                if fuzz.ratio(normalized, entry["normalized"]) >= similarity_threshold:
+                    best = (cached_query, entry)
+            return best
+
+    def _required_overlap(self, la: int, lb: int, min_ratio: float) -> int:
+        # ratio <= 2 * LCS / (la + lb), so the indel distance is at most
+        # (1 - r) * (la + lb); each indel destroys at most q padded q-grams.
+        max_indels = int((1 - min_ratio) * (la + lb))
+        return max(la, lb) + self.q - 1 - self.q * max_indels
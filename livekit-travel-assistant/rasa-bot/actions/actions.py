@@ -2,14 +2,21 @@ from typing import Any, Text, Dict, List
 from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet
-import requests
-from geopy.geocoders import Nominatim
 from datetime import datetime
 import os
+import sys
 import sqlite3
 import logging
 from dotenv import load_dotenv
 
+# Shared helpers (geocode cache, HTTP client, flight cache, airport index, ...) live in the project root, two levels up
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from geocache import GeocodeCache
+from flight_cache import flight_offers
+from airport_index import airport_index
+from config import HTTP_CONNECT_TIMEOUT, LLM_FALLBACK_TIMEOUT
+import http_client
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,14 +33,12 @@ load_dotenv()
 
 # API Keys from .env
 OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
-AMADEUS_API_KEY = os.getenv("AMADEUS_API_KEY")
-AMADEUS_API_SECRET = os.getenv("AMADEUS_API_SECRET")
 EXCHANGERATE_API_KEY = os.getenv("EXCHANGERATE_API_KEY")
 GEOAPIFY_API_KEY = os.getenv("GEOAPIFY_API_KEY")
 TIMEZONEDB_API_KEY = os.getenv("TIMEZONEDB_API_KEY")
 
-# Initialize geolocator
-geolocator = Nominatim(user_agent="travel_assistant")
+# Initialize geolocator (persistent geocode cache shared with the LLM service)
+geolocator = GeocodeCache()
 
 # Check if query_count column exists in query_history table
 def check_query_count_column(db_path: str = "/home/stjl0/livekit-travel-voice-assistant/db/query_history.db") -> bool:
@@ -159,7 +164,7 @@ class ActionProvideWeather(Action):
             return []
         try:
             url = f"https://api.openweathermap.org/data/2.5/weather?lat={loc.latitude}&lon={loc.longitude}&appid={OPENWEATHERMAP_API_KEY}&units=metric"
-            response = requests.get(url).json()
+            response = http_client.get(url).json()
             if response['cod'] != 200:
                 response_text = "Weather data not available."
                 dispatcher.utter_message(text=response_text)
@@ -192,30 +197,21 @@ class ActionProvideFlights(Action):
             dispatcher.utter_message(text=response)
             store_rasa_query(query, response, "get_flights")
             return []
+        from_code = airport_index.code_for(from_location)
+        to_code = airport_index.code_for(to_location)
+        if not (from_code and to_code):
+            response = "I couldn't find an airport for {}. Could you name a nearby city?".format(from_location if not from_code else to_location)
+            dispatcher.utter_message(text=response)
+            store_rasa_query(query, response, "get_flights")
+            return []
         try:
-            token_url = "https://test.api.amadeus.com/v1/security/oauth2/token"
-            data = {
-                "grant_type": "client_credentials",
-                "client_id": AMADEUS_API_KEY,
-                "client_secret": AMADEUS_API_SECRET
-            }
-            token_response = requests.post(token_url, data=data).json()
-            access_token = token_response.get("access_token")
-            if not access_token:
+            try:
+                response = flight_offers.search(from_code, to_code, datetime.today().date().isoformat(), adults=1)
+            except ValueError:
                 response = "Failed to authenticate with Amadeus API."
                 dispatcher.utter_message(text=response)
                 store_rasa_query(query, response, "get_flights")
                 return []
-            
-            url = "https://test.api.amadeus.com/v2/shopping/flight-offers"
-            params = {
-                "originLocationCode": from_location.upper()[:3],
-                "destinationLocationCode": to_location.upper()[:3],
-                "departureDate": datetime.today().date().isoformat(),
-                "adults": 1
-            }
-            headers = {"Authorization": f"Bearer {access_token}"}
-            response = requests.get(url, params=params, headers=headers).json()
             if 'data' in response and response['data']:
                 flight = response['data'][0]
                 duration = flight['itineraries'][0]['duration']
@@ -254,7 +250,7 @@ class ActionProvideAttractions(Action):
             return []
         try:
             url = f"https://api.geoapify.com/v2/places?categories=tourism.attraction&filter=circle:{loc.longitude},{loc.latitude},5000&apiKey={GEOAPIFY_API_KEY}"
-            response = requests.get(url).json()
+            response = http_client.get(url).json()
             attractions = [feature['properties']['name'] for feature in response['features'] if 'name' in feature['properties']][:3]
             if attractions:
                 response_text = f"Top attractions in {location}: {', '.join(attractions)}. Practical tip: Use public transport!"
@@ -287,7 +283,7 @@ class ActionProvideCurrency(Action):
             return []
         try:
             url = f"https://v6.exchangerate-api.com/v6/{EXCHANGERATE_API_KEY}/pair/{from_cur}/{to_cur}/{amount}"
-            response = requests.get(url).json()
+            response = http_client.get(url).json()
             if response['result'] == "success":
                 result = round(response['conversion_result'], 2)
                 response_text = f"{amount} {from_cur} is {result} {to_cur}—that's about the cost of a nice dinner!"
@@ -324,7 +320,7 @@ class ActionProvideTime(Action):
             return []
         try:
             url = f"http://api.timezonedb.com/v2.1/get-time-zone?key={TIMEZONEDB_API_KEY}&format=json&by=position&lat={loc.latitude}&lng={loc.longitude}"
-            response = requests.get(url).json()
+            response = http_client.get(url).json()
             if response['status'] == "OK":
                 time = datetime.fromtimestamp(response['timestamp']).strftime('%H:%M')
                 response_text = f"Current time in {location}: {time} ({response['zoneName']})."
@@ -350,8 +346,20 @@ class ActionLlmFallback(Action):
         try:
             # Call LLM Flask API
             url = "http://127.0.0.1:5000/llm"
-            payload = {"input": query, "chat_history": tracker.get_slot('chat_history') or []}
-            response = requests.post(url, json=payload).json()
+            payload = {
+                "input": query,
+                # The LLM service keeps the conversation per session, so only the new turn is sent
+                "session_id": tracker.sender_id,
+                # Lets the LLM service's model router weigh how ambiguous this turn was for Rasa
+                "rasa_confidence": (tracker.latest_message.get('intent') or {}).get('confidence')
+            }
+            http_response = http_client.post(url, json=payload, timeout=(HTTP_CONNECT_TIMEOUT, LLM_FALLBACK_TIMEOUT))
+            if http_response.status_code == 503:
+                # The LLM service is saturated; don't store this as the answer to the query
+                logger.warning(f"LLM fallback busy, retry after {http_response.headers.get('Retry-After')}s")
+                dispatcher.utter_message(text="I'm handling a lot of requests right now. Please try again in a moment.")
+                return []
+            response = http_response.json()
             llm_response = response.get('response', "Sorry, couldn't process that.")
             dispatcher.utter_message(text=llm_response)
             store_rasa_query(query, llm_response, "none")
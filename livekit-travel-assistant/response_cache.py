@@ -0,0 +1,124 @@
+import logging
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Callable, Dict, Optional, Tuple
+from config import RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_DEFAULT_TTL, TOOL_CACHE_TTLS
+
+logger = logging.getLogger(__name__)
+
+# backend(query, is_fresh, **lookup_kwargs) -> (response, tool_name, stored_at) or None
+Backend = Callable[..., Optional[Tuple[str, Optional[str], float]]]
+
+class ResponseCache:
+    """Bounded in-process LRU tier in front of the SQLite query_history cache.
+
+    Entries expire per tool_name (see config.TOOL_CACHE_TTLS); a tool label made
+    of several comma-separated tools uses the shortest TTL. invalidate_tool()
+    drops a tool's entries from both tiers, e.g. after a currency rates update.
+    """
+
+    def __init__(self, backend: Optional[Backend] = None, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 ttls: Optional[Dict[str, int]] = None, default_ttl: int = RESPONSE_CACHE_DEFAULT_TTL):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.ttls = dict(TOOL_CACHE_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._invalidated_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def ttl_for(self, tool_name: Optional[str]) -> int:
+        """TTL in seconds for a tool label; 0 means never cache."""
+        names = [name.strip() for name in (tool_name or "none").split(",") if name.strip()] or ["none"]
+        return min(self.ttls.get(name, self.default_ttl) for name in names)
+
+    def is_fresh(self, tool_name: Optional[str], stored_at: float, now: Optional[float] = None) -> bool:
+        now = time() if now is None else now
+        ttl = self.ttl_for(tool_name)
+        if ttl <= 0 or now - stored_at >= ttl:
+            return False
+        for name in (tool_name or "none").split(","):
+            if stored_at < self._invalidated_at.get(name.strip(), 0):
+                return False
+        return True
+
+    def get(self, query: str, **lookup_kwargs) -> Optional[str]:
+        """Look up the LRU tier, then the backend; lookup_kwargs are passed to the backend."""
+        key = self.normalize(query)
+        now = time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self.is_fresh(entry["tool_name"], entry["stored_at"], now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["response"]
+                del self._entries[key]
+                self.expirations += 1
+
+        row = None
+        if self.backend is not None:
+            try:
+                row = self.backend(query, self.is_fresh, **lookup_kwargs)
+            except Exception as e:
+                logger.error(f"Response cache backend error: {e}")
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.backend_hits += 1
+        response, tool_name, stored_at = row
+        self._store(key, response, tool_name, stored_at)
+        return response
+
+    def put(self, query: str, response: str, tool_name: Optional[str], stored_at: Optional[float] = None):
+        """Add a response to the in-process tier; the caller persists it to SQLite."""
+        self._store(self.normalize(query), response, tool_name, time() if stored_at is None else stored_at)
+
+    def _store(self, key: str, response: str, tool_name: Optional[str], stored_at: float):
+        if self.max_entries <= 0 or not self.is_fresh(tool_name, stored_at):
+            return
+        with self._lock:
+            self._entries[key] = {"response": response, "tool_name": tool_name, "stored_at": stored_at}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_tool(self, tool_name: str):
+        """Expire every cached response produced by tool_name, in both tiers."""
+        with self._lock:
+            self._invalidated_at[tool_name] = time()
+            stale = [key for key, entry in self._entries.items()
+                     if tool_name in (entry["tool_name"] or "none").split(",")]
+            for key in stale:
+                del self._entries[key]
+        logger.info(f"Invalidated {len(stale)} cached responses for {tool_name}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.backend_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "backend_hits": self.backend_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round((self.hits + self.backend_hits) / lookups, 4) if lookups else 0.0,
+            }
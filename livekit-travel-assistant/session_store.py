@@ -0,0 +1,258 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from time import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+from langgraph.checkpoint.base import BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple, get_checkpoint_id
+from db_connection import ConnectionManager
+from config import SESSION_DB_PATH, SESSION_CACHE_MAX_SESSIONS, SESSION_TTL
+
+logger = logging.getLogger(__name__)
+
+# How many puts between sweeps of expired sessions on disk
+PURGE_EVERY = 500
+
+class _Session:
+    __slots__ = ("checkpoint_id", "parent_id", "checkpoint", "metadata", "writes", "updated_at")
+
+    def __init__(self, checkpoint_id: str, parent_id: Optional[str], checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                 writes: List[Tuple[str, str, Any]], updated_at: float):
+        self.checkpoint_id = checkpoint_id
+        self.parent_id = parent_id
+        self.checkpoint = checkpoint
+        self.metadata = metadata
+        self.writes = writes
+        self.updated_at = updated_at
+
+class SessionCheckpointer(BaseCheckpointSaver):
+    """LangGraph checkpointer that keeps the latest checkpoint of each session in SQLite.
+
+    Only the newest checkpoint per (thread_id, checkpoint_ns) is kept, written
+    through to disk on every put so sessions survive a restart. The most recently
+    used max_sessions are also held in an in-memory LRU; older ones are evicted
+    and reloaded from SQLite on their next turn. Sessions idle for longer than
+    ttl seconds are treated as new and purged from disk periodically.
+    """
+
+    def __init__(self, db_path: str = SESSION_DB_PATH, max_sessions: int = SESSION_CACHE_MAX_SESSIONS, ttl: float = SESSION_TTL):
+        super().__init__()
+        self.db_path = db_path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._connections = ConnectionManager(db_path)
+        self._hot: "OrderedDict[Tuple[str, str], _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.expired = 0
+        self.init_db()
+
+    def init_db(self):
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = self._connections.get()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_id TEXT,
+                    checkpoint_type TEXT NOT NULL,
+                    checkpoint BLOB NOT NULL,
+                    metadata_type TEXT NOT NULL,
+                    metadata BLOB NOT NULL,
+                    writes_type TEXT,
+                    writes BLOB,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (thread_id, checkpoint_ns)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)")
+            conn.commit()
+            logger.info("Session database initialized successfully")
+        except Exception as e:
+            logger.error(f"Error initializing session database: {e}")
+            raise
+
+    def _expired(self, session: _Session) -> bool:
+        return self.ttl > 0 and time() - session.updated_at > self.ttl
+
+    def _remember(self, key: Tuple[str, str], session: _Session):
+        """Insert into the LRU tier; the caller holds the lock."""
+        self._hot[key] = session
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.max_sessions:
+            self._hot.popitem(last=False)
+            self.evictions += 1
+
+    def _load(self, key: Tuple[str, str]) -> Optional[_Session]:
+        row = self._connections.get().execute(
+            "SELECT checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata, writes_type, writes, updated_at "
+            "FROM sessions WHERE thread_id = ? AND checkpoint_ns = ?", key).fetchone()
+        if not row:
+            return None
+        checkpoint_id, parent_id, checkpoint_type, checkpoint, metadata_type, metadata, writes_type, writes, updated_at = row
+        return _Session(
+            checkpoint_id, parent_id,
+            self.serde.loads_typed((checkpoint_type, checkpoint)),
+            self.serde.loads_typed((metadata_type, metadata)),
+            self.serde.loads_typed((writes_type, writes)) if writes_type else [],
+            updated_at,
+        )
+
+    def _store(self, key: Tuple[str, str], session: _Session):
+        checkpoint_type, checkpoint = self.serde.dumps_typed(session.checkpoint)
+        metadata_type, metadata = self.serde.dumps_typed(session.metadata)
+        writes_type, writes = self.serde.dumps_typed(session.writes) if session.writes else (None, None)
+        conn = self._connections.get()
+        conn.execute("""
+            INSERT OR REPLACE INTO sessions (thread_id, checkpoint_ns, checkpoint_id, parent_id, checkpoint_type, checkpoint,
+                                             metadata_type, metadata, writes_type, writes, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (*key, session.checkpoint_id, session.parent_id, checkpoint_type, checkpoint,
+              metadata_type, metadata, writes_type, writes, session.updated_at))
+        conn.commit()
+
+    def _session(self, key: Tuple[str, str]) -> Optional[_Session]:
+        with self._lock:
+            session = self._hot.get(key)
+            if session is not None:
+                self._hot.move_to_end(key)
+                self.hits += 1
+        if session is None:
+            session = self._load(key)
+            if session is None:
+                return None
+            with self._lock:
+                self.loads += 1
+                self._remember(key, session)
+        if self._expired(session):
+            self.delete_thread(key[0])
+            with self._lock:
+                self.expired += 1
+            return None
+        return session
+
+    @staticmethod
+    def _key(config: Dict) -> Tuple[str, str]:
+        configurable = config["configurable"]
+        return str(configurable["thread_id"]), configurable.get("checkpoint_ns", "")
+
+    def _tuple(self, key: Tuple[str, str], session: _Session) -> CheckpointTuple:
+        thread_id, checkpoint_ns = key
+        parent_config = None
+        if session.parent_id:
+            parent_config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": session.parent_id}}
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": session.checkpoint_id}},
+            checkpoint=session.checkpoint,
+            metadata=session.metadata,
+            parent_config=parent_config,
+            pending_writes=list(session.writes),
+        )
+
+    def get_tuple(self, config: Dict) -> Optional[CheckpointTuple]:
+        key = self._key(config)
+        session = self._session(key)
+        if session is None:
+            return None
+        # Only the latest checkpoint is kept; older ids are gone
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id and checkpoint_id != session.checkpoint_id:
+            return None
+        return self._tuple(key, session)
+
+    def list(self, config: Optional[Dict], *, filter: Optional[Dict[str, Any]] = None, before: Optional[Dict] = None,
+             limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        if config is None:
+            keys = [tuple(row) for row in self._connections.get().execute("SELECT thread_id, checkpoint_ns FROM sessions")]
+        else:
+            keys = [self._key(config)]
+        count = 0
+        for key in keys:
+            session = self._session(key)
+            if session is None or (before and get_checkpoint_id(before) == session.checkpoint_id):
+                continue
+            if filter and any(session.metadata.get(k) != v for k, v in filter.items()):
+                continue
+            yield self._tuple(key, session)
+            count += 1
+            if limit is not None and count >= limit:
+                return
+
+    def put(self, config: Dict, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> Dict:
+        key = self._key(config)
+        session = _Session(checkpoint["id"], get_checkpoint_id(config), checkpoint, metadata, [], time())
+        self._store(key, session)
+        with self._lock:
+            self._remember(key, session)
+            self._puts += 1
+            purge = self._puts % PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+        return {"configurable": {"thread_id": key[0], "checkpoint_ns": key[1], "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: Dict, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        key = self._key(config)
+        session = self._session(key)
+        if session is None or session.checkpoint_id != get_checkpoint_id(config):
+            return
+        with self._lock:
+            session.writes = [w for w in session.writes if w[0] != task_id] + [(task_id, channel, value) for channel, value in writes]
+            session.updated_at = time()
+        self._store(key, session)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [key for key in self._hot if key[0] == thread_id]:
+                del self._hot[key]
+        conn = self._connections.get()
+        conn.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+        conn.commit()
+
+    def purge_expired(self) -> int:
+        """Delete sessions idle for longer than the TTL from disk and memory."""
+        if self.ttl <= 0:
+            return 0
+        cutoff = time() - self.ttl
+        try:
+            conn = self._connections.get()
+            deleted = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+            conn.commit()
+            with self._lock:
+                for key in [key for key, session in self._hot.items() if session.updated_at < cutoff]:
+                    del self._hot[key]
+            logger.info(f"Purged {deleted} expired sessions")
+            return deleted
+        except Exception as e:
+            logger.error(f"Error purging expired sessions: {e}")
+            return 0
+
+    async def aget_tuple(self, config: Dict) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(self, config: Optional[Dict], *, filter: Optional[Dict[str, Any]] = None, before: Optional[Dict] = None,
+                    limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config: Dict, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> Dict:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: Dict, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hot_sessions": len(self._hot),
+                "max_sessions": self.max_sessions,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "open_connections": self._connections.open_connections(),
+            }
@@ -0,0 +1,117 @@
+import logging
+import random
+import threading
+from collections import deque
+from time import time
+from typing import Any, Callable, Dict
+import numpy as np
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel
+from config import MODEL_USE_MMAP, SPECULATIVE_DRAFT_TOKENS, SPECULATIVE_BASELINE_RATE
+
+logger = logging.getLogger(__name__)
+
+class SpeculativeStats:
+    """Acceptance of drafted tokens and measured decoding speed with and without a draft model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.proposed = 0
+        self.accepted = 0
+        self.verify_steps = 0
+        # (seconds, generated tokens) of recent generations, per mode
+        self._runs = {"speculative": deque(maxlen=200), "baseline": deque(maxlen=200)}
+
+    def record_step(self, proposed: int, accepted: int):
+        with self._lock:
+            self.proposed += proposed
+            self.accepted += accepted
+            self.verify_steps += 1
+
+    def record_run(self, mode: str, seconds: float, tokens: int):
+        with self._lock:
+            self._runs[mode].append((seconds, tokens))
+
+    def _tokens_per_second(self, mode: str) -> float:
+        runs = self._runs[mode]
+        seconds = sum(run[0] for run in runs)
+        return sum(run[1] for run in runs) / seconds if seconds else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            speculative, baseline = self._tokens_per_second("speculative"), self._tokens_per_second("baseline")
+            return {
+                "proposed_tokens": self.proposed,
+                "accepted_tokens": self.accepted,
+                "acceptance_rate": round(self.accepted / self.proposed, 3) if self.proposed else 0.0,
+                # Tokens produced per forward pass of the large model (1.0 without speculation)
+                "tokens_per_verify_step": round((self.accepted + self.verify_steps) / self.verify_steps, 2) if self.verify_steps else 0.0,
+                "speculative_tokens_per_second": round(speculative, 2),
+                "baseline_tokens_per_second": round(baseline, 2),
+                "speedup": round(speculative / baseline, 2) if speculative and baseline else None,
+                "runs": {mode: len(runs) for mode, runs in self._runs.items()},
+            }
+
+speculative_stats = SpeculativeStats()
+
+class LlamaDraft(LlamaDraftModel):
+    """Drafts tokens for a larger Llama with a small model that shares its vocabulary (1B for 3B).
+
+    llama-cpp-python evaluates the drafted tokens in one batch on the large model
+    and keeps only those the large model samples itself, so output follows the
+    large model's distribution; with greedy sampling it is token-for-token
+    identical to decoding without a draft. The draft runs greedily in its own
+    context over the memory-mapped small model, owned by the large model's context.
+    """
+
+    def __init__(self, model_path: str, num_draft_tokens: int = SPECULATIVE_DRAFT_TOKENS, stats: SpeculativeStats = speculative_stats, **params):
+        self.num_draft_tokens = num_draft_tokens
+        self.stats = stats
+        self.model = Llama(model_path=model_path, use_mmap=MODEL_USE_MMAP, verbose=False, **params)
+        self._last_len = 0
+        self._pending = 0
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        n = len(input_ids)
+        # The large model keeps the accepted drafts plus one token of its own before drafting again
+        if self._pending and self._last_len < n <= self._last_len + self._pending + 1:
+            self.stats.record_step(self._pending, n - self._last_len - 1)
+        draft = []
+        eos = self.model.token_eos()
+        for token in self.model.generate(input_ids.tolist(), temp=0.0, top_k=1):
+            if token == eos:
+                break
+            draft.append(token)
+            if len(draft) >= self.num_draft_tokens:
+                break
+        self._last_len, self._pending = n, len(draft)
+        return np.array(draft, dtype=np.intc)
+
+def draft_params(draft_model_path: str, **params) -> Dict[str, Any]:
+    """LlamaCpp settings that attach a LlamaDraft; verifying drafts needs logits for every position."""
+    return {"logits_all": True, "model_kwargs": {"draft_model": LlamaDraft(draft_model_path, **params)}}
+
+def timed_generation(model, generate: Callable[[], str], stats: SpeculativeStats = speculative_stats) -> str:
+    """Run generate() on model and record its speed.
+
+    For models with a draft attached, a SPECULATIVE_BASELINE_RATE share of
+    generations run with the draft detached so the speedup can be measured on
+    live traffic. Must be called on the thread that owns model.
+    """
+    client = model.client
+    draft = getattr(client, "draft_model", None)
+    if not isinstance(draft, LlamaDraft):
+        return generate()
+    mode = "baseline" if random.random() < SPECULATIVE_BASELINE_RATE else "speculative"
+    if mode == "baseline":
+        client.draft_model = None
+    start = time()
+    try:
+        result = generate()
+    finally:
+        client.draft_model = draft
+    seconds = time() - start
+    tokens = len(client.tokenize(result.encode("utf-8"), add_bos=False)) if result else 0
+    stats.record_run(mode, seconds, tokens)
+    logger.info(f"Generation ({mode}): {tokens} tokens in {seconds:.2f} seconds")
+    return result
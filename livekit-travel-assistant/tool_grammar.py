@@ -0,0 +1,126 @@
+import logging
+import math
+import threading
+import weakref
+from typing import Any, Dict, Optional
+from config import LLM_GRAMMAR, LLM_MAX_TOOL_CALLS, LLM_TEXT_MAX_TOKENS, LLM_ARG_MAX_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# JSON value rules for the parameter types the tools use
+VALUE_RULES = {
+    "string": 'string ::= "\\"" ([^"\\\\\\n] | "\\\\" ["\\\\/bfnrt])* "\\""',
+    "number": 'number ::= "-"? [0-9]+ ("." [0-9]+)?',
+    "integer": 'integer ::= "-"? [0-9]+',
+    "boolean": 'boolean ::= "true" | "false"',
+}
+# One line of plain text that cannot be mistaken for a tool call
+TEXT_RULE = 'text ::= [^{[ \\n] [^\\n]*'
+
+def _literal(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _rule_name(tool_name: str) -> str:
+    # GBNF rule names may not contain underscores
+    return "call-" + tool_name.replace("_", "-")
+
+def _parameter_types(tool) -> Dict[str, str]:
+    return {name: schema.get("type", "string") for name, schema in tool.args.items()}
+
+def build_grammar(tools, max_calls: int = LLM_MAX_TOOL_CALLS, allow_text: bool = True) -> str:
+    """GBNF for the hybrid agent's output: one tool call, a list of up to max_calls, or plain text.
+
+    Calls are written in the canonical form of the system prompt examples with
+    the parameter names of each tool's schema, so "from_city" or a trailing
+    note can no longer be generated. Without allow_text the output is a plan:
+    a possibly empty list of calls.
+    """
+    rules, value_types = [], set()
+    for tool in tools:
+        params = _parameter_types(tool)
+        head = _literal(f'{{"name": "{tool.name}", "parameters": {{')
+        parts = []
+        for i, (name, kind) in enumerate(params.items()):
+            kind = kind if kind in VALUE_RULES else "string"
+            value_types.add(kind)
+            parts.append(_literal(f'{", " if i else ""}"{name}": ') + " " + kind)
+        rules.append(f"{_rule_name(tool.name)} ::= " + " ".join([head] + parts + [_literal("}}")]))
+    call = "call ::= " + " | ".join(_rule_name(tool.name) for tool in tools)
+    calls = 'calls ::= "[" call' + ' (", " call' * (max_calls - 1) + ")?" * (max_calls - 1) + ' "]"'
+    if allow_text:
+        root, extra = 'root ::= " "? (call | calls | text)', [TEXT_RULE]
+    else:
+        root, extra = 'root ::= " "? ("[]" | calls)', []
+    return "\n".join([root, call, calls] + rules + [VALUE_RULES[kind] for kind in sorted(value_types)] + extra) + "\n"
+
+class ToolGrammar:
+    """Grammar-constrained decoding settings for one hybrid agent turn.
+
+    kwargs_for() returns max_tokens and this object as tool_grammar; the LLM
+    wrapper swaps the latter for grammar_for(client) once the scheduler has
+    picked a context. max_tokens covers the longest output the grammar allows
+    (max_calls of the largest calls, or a text answer), so a turn is never cut
+    off mid-JSON; generation stops on its own once the grammar completes. Each
+    Llama context gets its own compiled grammar because llama-cpp-python keeps
+    parse state on the grammar object while sampling, and contexts of one model
+    sample concurrently.
+    """
+
+    def __init__(self, tools, enabled: bool = LLM_GRAMMAR, max_calls: int = LLM_MAX_TOOL_CALLS,
+                 text_max_tokens: int = LLM_TEXT_MAX_TOKENS, arg_max_tokens: int = LLM_ARG_MAX_TOKENS, allow_text: bool = True):
+        self.enabled = enabled
+        self.max_calls = max_calls
+        self.text_max_tokens = text_max_tokens
+        self.gbnf = build_grammar(tools, max_calls, allow_text)
+        # About three characters per token for the fixed JSON, plus a budget per argument
+        self.call_budgets = {
+            tool.name: math.ceil(len(f'{{"name": "{tool.name}", "parameters": {{}}}}') / 3)
+            + sum(math.ceil(len(f'"{name}": "", ') / 3) + arg_max_tokens for name in tool.args)
+            for tool in tools
+        }
+        # A list of calls adds brackets and separators
+        largest = sorted(self.call_budgets.values(), reverse=True)[:max_calls]
+        self.calls_max_tokens = sum(largest) + 2 * len(largest) + 2
+        self.max_output_tokens = max(self.calls_max_tokens, text_max_tokens) if allow_text else self.calls_max_tokens
+        # Keyed on the Llama client, so a context's grammar goes away when the context is unloaded
+        self._compiled: "weakref.WeakKeyDictionary[Any, Optional[Any]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def grammar_for(self, client: Any) -> Optional[Any]:
+        """The compiled grammar for one Llama context; only use it on the thread that owns client."""
+        with self._lock:
+            if client not in self._compiled:
+                try:
+                    from llama_cpp import LlamaGrammar
+                    self._compiled[client] = LlamaGrammar.from_string(self.gbnf, verbose=False)
+                except Exception as e:
+                    # Generation still works unconstrained, parse failures are handled downstream
+                    logger.error(f"Error compiling tool grammar, decoding unconstrained: {e}")
+                    self._compiled[client] = None
+            return self._compiled[client]
+
+    def kwargs_for(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {}
+        return {"max_tokens": self.max_output_tokens, "tool_grammar": self}
+
+    @staticmethod
+    def resolve(client: Any, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Replace a tool_grammar entry of kwargs_for() output with the grammar compiled for client."""
+        tool_grammar = kwargs.get("tool_grammar")
+        if tool_grammar is None:
+            return kwargs
+        kwargs = {key: value for key, value in kwargs.items() if key != "tool_grammar"}
+        grammar = tool_grammar.grammar_for(client)
+        if grammar is not None:
+            kwargs["grammar"] = grammar
+        return kwargs
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "compiled_contexts": sum(grammar is not None for grammar in list(self._compiled.values())),
+            "text_max_tokens": self.text_max_tokens,
+            "max_output_tokens": self.max_output_tokens,
+            "call_budgets": self.call_budgets,
+        }
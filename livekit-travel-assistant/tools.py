@@ -1,45 +1,23 @@
-import requests
-from geopy.geocoders import Nominatim
+import http_client
+import async_tools
 from datetime import datetime, date
 from langchain_core.tools import tool
-from config import OPENWEATHERMAP_API_KEY, AMADEUS_API_KEY, AMADEUS_API_SECRET, GEOAPIFY_API_KEY, TIMEZONEDB_API_KEY, EXCHANGERATE_API_KEY
+from config import OPENWEATHERMAP_API_KEY, GEOAPIFY_API_KEY, TIMEZONEDB_API_KEY, EXCHANGERATE_API_KEY, CURRENCY_RATES_CHECK_INTERVAL
 import random
-from functools import lru_cache
-from time import time
 import logging
 from currency_converter import CurrencyConverter
+from geocache import GeocodeCache
+from flight_cache import flight_offers
+from airport_index import airport_index
+from database import response_cache
 
 logger = logging.getLogger(__name__)
 
-geolocator = Nominatim(user_agent="travel_assistant")
-
-IATA_CODES = {
-    "new york": "NYC",
-    "london": "LON",
-    "new delhi": "DEL",
-    "mumbai": "BOM",
-    "paris": "PAR"
-}
-
-@lru_cache(maxsize=1)
-def get_amadeus_token():
-    """Gets and caches Amadeus API token."""
-    token_url = "https://test.api.amadeus.com/v1/security/oauth2/token"
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": AMADEUS_API_KEY,
-        "client_secret": AMADEUS_API_SECRET
-    }
-    try:
-        response = requests.post(token_url, data=data).json()
-        logger.debug(f"Amadeus token response: {response}")
-        access_token = response.get("access_token")
-        if not access_token:
-            raise ValueError("Failed to authenticate with Amadeus API.")
-        return access_token, time() + response.get("expires_in", 1799)
-    except Exception as e:
-        logger.error(f"Amadeus API error: {e}")
-        raise
+geolocator = GeocodeCache()
+
+currency_converter = CurrencyConverter(access_key=EXCHANGERATE_API_KEY, rates_check_interval=CURRENCY_RATES_CHECK_INTERVAL)
+# Expire cached conversions whenever the exchange rates change, in this or another process
+currency_converter.add_update_listener(lambda: response_cache.invalidate_tool("get_currency_conversion"))
 
 @tool
 def get_weather(location: str) -> str:
@@ -49,7 +27,7 @@ def get_weather(location: str) -> str:
         return "Location not found. Ask for confirmation."
     url = f"https://api.openweathermap.org/data/2.5/weather?lat={loc.latitude}&lon={loc.longitude}&appid={OPENWEATHERMAP_API_KEY}&units=metric"
     try:
-        response = requests.get(url).json()
+        response = http_client.get(url).json()
         logger.debug(f"Weather API response: {response}")
         if response['cod'] != 200:
             return f"Weather data not available: {response.get('message', 'Unknown error')}"
@@ -64,24 +42,12 @@ def get_weather(location: str) -> str:
 @tool
 def get_flights(from_location: str, to_location: str) -> str:
     """Searches for flights between two locations, returning duration and price if available."""
-    from_code = IATA_CODES.get(from_location.lower())
-    to_code = IATA_CODES.get(to_location.lower())
+    from_code = airport_index.code_for(from_location)
+    to_code = airport_index.code_for(to_location)
     if not from_code or not to_code:
-        return f"Invalid airport codes for {from_location} or {to_location}. Please use city names like 'New York' or 'London'."
+        return f"Couldn't find an airport for {from_location if not from_code else to_location}. Please use a city or airport name like 'New York' or 'Heathrow'."
     try:
-        access_token, expiry = get_amadeus_token()
-        if time() > expiry:
-            get_amadeus_token.cache_clear()
-            access_token, expiry = get_amadeus_token()
-        url = "https://test.api.amadeus.com/v2/shopping/flight-offers"
-        params = {
-            "originLocationCode": from_code,
-            "destinationLocationCode": to_code,
-            "departureDate": date.today().isoformat(),
-            "adults": 1
-        }
-        headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get(url, params=params, headers=headers).json()
+        response = flight_offers.search(from_code, to_code, date.today().isoformat(), adults=1)
         logger.debug(f"Flights API response: {response}")
         if 'data' in response and response['data']:
             flight = response['data'][0]
@@ -101,7 +67,7 @@ def get_attractions(location: str) -> str:
         return "Location not found. Ask for confirmation."
     url = f"https://api.geoapify.com/v2/places?categories=tourism.attraction&filter=circle:{loc.longitude},{loc.latitude},10000&apiKey={GEOAPIFY_API_KEY}"
     try:
-        response = requests.get(url).json()
+        response = http_client.get(url).json()
         logger.debug(f"Attractions API response: {response}")
         attractions = [feature['properties']['name'] for feature in response['features'] if 'name' in feature['properties']][:3]
         if not attractions:
@@ -148,7 +114,7 @@ def get_time(location: str) -> str:
         return "Location not found. Ask for confirmation."
     url = f"http://api.timezonedb.com/v2.1/get-time-zone?key={TIMEZONEDB_API_KEY}&format=json&by=position&lat={loc.latitude}&lng={loc.longitude}"
     try:
-        response = requests.get(url).json()
+        response = http_client.get(url).json()
         logger.debug(f"Time API response: {response}")
         if response['status'] == 'OK':
             time = datetime.fromtimestamp(response['timestamp']).strftime('%H:%M')
@@ -168,6 +134,28 @@ def get_joke() -> str:
     ]
     return random.choice(jokes)
 
+# Async implementations, used by tool.ainvoke() when independent tool calls are fanned out
+async def _aget_weather(location: str) -> str:
+    return await async_tools.fetch_weather(location, geolocator)
+
+async def _aget_flights(from_location: str, to_location: str) -> str:
+    from_code = airport_index.code_for(from_location)
+    to_code = airport_index.code_for(to_location)
+    if not from_code or not to_code:
+        return f"Couldn't find an airport for {from_location if not from_code else to_location}. Please use a city or airport name like 'New York' or 'Heathrow'."
+    return await async_tools.fetch_flights(from_location, to_location, from_code, to_code, flight_offers)
+
+async def _aget_attractions(location: str) -> str:
+    return await async_tools.fetch_attractions(location, geolocator)
+
+async def _aget_time(location: str) -> str:
+    return await async_tools.fetch_time(location, geolocator)
+
+get_weather.coroutine = _aget_weather
+get_flights.coroutine = _aget_flights
+get_attractions.coroutine = _aget_attractions
+get_time.coroutine = _aget_time
+
 # Export the tools list for use in agent.py
 tools = [
     get_weather,
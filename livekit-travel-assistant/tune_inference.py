@@ -0,0 +1,153 @@
+# tune_inference.py
+# Benchmarks prompt-eval and generation speed of the configured GGUF models on this host
+# across thread counts, batch sizes and the quantizations found next to each model
+# (e.g. Llama3.2-1B-Instruct-Q4_K_M.gguf beside Llama3.2-1B-Instruct.gguf), then writes
+# the fastest settings per model to INFERENCE_PROFILE_PATH for model_loader.load_llama.
+# Usage: python3 tune_inference.py [--models 1b,3b] [--threads 2,4,8] [--batch 128,512] [--output path]
+
+import argparse
+import gc
+import glob
+import json
+import os
+import socket
+import sys
+from datetime import datetime
+from time import time
+from typing import Any, Dict, List
+import llama_cpp
+from llama_cpp import Llama
+from config import MODEL_1B_PATH, MODEL_3B_PATH, MODEL_USE_MMAP, INFERENCE_PROFILE_PATH, SYSTEM_MESSAGE
+
+MODELS = {"1b": MODEL_1B_PATH, "3b": MODEL_3B_PATH}
+N_CTX = 1024
+
+def quantizations(model_path: str) -> List[str]:
+    """The configured model file plus any sibling GGUF files with the same name prefix."""
+    base = os.path.splitext(model_path)[0]
+    paths = set(glob.glob(glob.escape(base) + "*.gguf"))
+    if os.path.exists(model_path):
+        paths.add(model_path)
+    return sorted(paths)
+
+def default_threads() -> List[int]:
+    cores = os.cpu_count() or 4
+    candidates = {cores, max(1, cores // 2)}
+    n = 1
+    while n < cores:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+def gpu_layers() -> int:
+    supports_gpu = getattr(llama_cpp, "llama_supports_gpu_offload", lambda: False)
+    return 50 if supports_gpu() else 0
+
+def bench(model_path: str, n_threads: int, n_batch: int, n_gpu_layers: int, prompt_tokens: int, gen_tokens: int) -> Dict[str, Any]:
+    """Tokens per second for evaluating a prompt_tokens prompt and for generating gen_tokens greedily."""
+    llm = Llama(model_path=model_path, n_ctx=N_CTX, n_threads=n_threads, n_batch=n_batch,
+                n_gpu_layers=n_gpu_layers, use_mmap=MODEL_USE_MMAP, verbose=False)
+    try:
+        text = SYSTEM_MESSAGE.encode("utf-8")
+        tokens = llm.tokenize(text, add_bos=True)
+        while len(tokens) < prompt_tokens:
+            tokens += llm.tokenize(text, add_bos=False)
+        tokens = tokens[:prompt_tokens]
+        # Page in the weights before timing anything
+        llm.eval(tokens[:8])
+        llm.reset()
+        start = time()
+        llm.eval(tokens)
+        prompt_seconds = time() - start
+        llm.reset()
+        generated = 0
+        start = time()
+        for _ in llm.generate(tokens[:8], temp=0.0, top_k=1):
+            generated += 1
+            if generated >= gen_tokens:
+                break
+        gen_seconds = time() - start
+    finally:
+        del llm
+        gc.collect()
+    return {
+        "model_path": model_path,
+        "n_threads": n_threads,
+        "n_batch": n_batch,
+        "n_gpu_layers": n_gpu_layers,
+        "prompt_tokens_per_second": round(len(tokens) / prompt_seconds, 1),
+        "generation_tokens_per_second": round(generated / gen_seconds, 1),
+    }
+
+def turn_seconds(result: Dict[str, Any], turn_prompt_tokens: int, turn_gen_tokens: int) -> float:
+    """Estimated latency of a typical /llm turn, the quantity the profile minimizes."""
+    return turn_prompt_tokens / result["prompt_tokens_per_second"] + turn_gen_tokens / result["generation_tokens_per_second"]
+
+def tune_model(model_path: str, threads: List[int], batches: List[int], args) -> Dict[str, Any]:
+    """Sweep thread counts at the largest batch size, then batch sizes at the best thread count, per quantization."""
+    results = []
+    n_gpu_layers = gpu_layers()
+
+    def run(path, n_threads, n_batch):
+        result = bench(path, n_threads, n_batch, n_gpu_layers, args.prompt_tokens, args.gen_tokens)
+        result["turn_seconds"] = round(turn_seconds(result, args.turn_prompt_tokens, args.turn_gen_tokens), 3)
+        results.append(result)
+        print(f"{os.path.basename(path):<40}{n_threads:>8}{n_batch:>8}{result['prompt_tokens_per_second']:>12}"
+              f"{result['generation_tokens_per_second']:>12}{result['turn_seconds']:>10}")
+        return result
+
+    for path in quantizations(model_path):
+        by_threads = [run(path, n_threads, max(batches)) for n_threads in threads]
+        best_threads = min(by_threads, key=lambda r: r["turn_seconds"])["n_threads"]
+        for n_batch in batches:
+            if n_batch != max(batches):
+                run(path, best_threads, n_batch)
+    best = min(results, key=lambda r: r["turn_seconds"])
+    return {"best": best, "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune llama.cpp settings for this host")
+    parser.add_argument("--models", default="1b,3b", help="comma-separated subset of 1b,3b")
+    parser.add_argument("--threads", help="comma-separated thread counts (default: powers of two up to all cores)")
+    parser.add_argument("--batch", default="64,128,256,512", help="comma-separated n_batch values")
+    parser.add_argument("--prompt-tokens", type=int, default=512, help="prompt length for the prompt-eval benchmark")
+    parser.add_argument("--gen-tokens", type=int, default=64, help="tokens generated in the generation benchmark")
+    parser.add_argument("--turn-prompt-tokens", type=int, default=400, help="prompt tokens of a typical turn")
+    parser.add_argument("--turn-gen-tokens", type=int, default=40, help="generated tokens of a typical turn")
+    parser.add_argument("--output", default=INFERENCE_PROFILE_PATH)
+    args = parser.parse_args()
+
+    threads = [int(n) for n in args.threads.split(",")] if args.threads else default_threads()
+    batches = sorted(int(n) for n in args.batch.split(","))
+    if args.prompt_tokens + args.gen_tokens > N_CTX:
+        sys.exit(f"--prompt-tokens plus --gen-tokens must fit in the {N_CTX} token context")
+
+    profile = {
+        "host": socket.gethostname(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "cpu_count": os.cpu_count(),
+        "llama_cpp_version": getattr(llama_cpp, "__version__", "unknown"),
+        "models": {},
+        "results": {},
+    }
+    print(f"{'model file':<40}{'threads':>8}{'batch':>8}{'prompt t/s':>12}{'gen t/s':>12}{'turn s':>10}")
+    for name in args.models.split(","):
+        model_path = MODELS[name]
+        if not quantizations(model_path):
+            print(f"No GGUF files found for {name} at {model_path}, skipping")
+            continue
+        tuned = tune_model(model_path, threads, batches, args)
+        # Keyed by the configured path, which is what load_llama is called with
+        profile["models"][model_path] = tuned["best"]
+        profile["results"][name] = tuned["results"]
+        best = tuned["best"]
+        print(f"{name}: {os.path.basename(best['model_path'])}, n_threads={best['n_threads']}, "
+              f"n_batch={best['n_batch']}, {best['turn_seconds']}s per typical turn")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(profile, f, indent=2)
+    print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()